@@ -0,0 +1,124 @@
+"""Total time to fan a status alert out to many watchers.
+
+A mocked Bot simulates API latency, Telegram's global flood limit (raising
+RetryAfter when it is exceeded) and a share of users who blocked the bot
+(raising Forbidden). Three senders are compared:
+
+* legacy: the original sequential loop, which stops at the first error
+* sequential: the same loop carrying on past errors
+* unthrottled: Broadcaster without a rate limit, relying on RetryAfter
+* broadcaster: Broadcaster with the default rate limits
+
+Time runs --scale times faster than real time so a run takes seconds;
+reported durations are scaled back up.
+
+Usage: python benchmarks/bench_broadcast.py [--recipients N] [--scale S]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import Forbidden, RetryAfter  # noqa: E402
+
+import broadcast  # noqa: E402
+from benchmarks.fakes import FakeBot  # noqa: E402
+from fetch_scheduler import TokenBucket  # noqa: E402
+
+TELEGRAM_RATE = 30
+RETRY_AFTER = 5
+
+
+class FloodLimitedBot(FakeBot):
+    def __init__(self, latency, scale, blocked):
+        super().__init__(latency)
+        self.scale = scale
+        self.blocked = blocked
+        self.flood_limit = TokenBucket(TELEGRAM_RATE * scale, TELEGRAM_RATE)
+        self.flood_errors = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.flood_limit._refill()
+        if self.flood_limit.tokens < 1:
+            self.flood_errors += 1
+            raise RetryAfter(RETRY_AFTER / self.scale)
+        self.flood_limit.tokens -= 1
+        if chat_id in self.blocked:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+async def legacy(bot, chat_ids, scale):
+    for user_id in chat_ids:
+        await bot.send_message(chat_id=user_id, text="Server is back online!")
+    return "completed"
+
+
+async def sequential(bot, chat_ids, scale):
+    errors = 0
+    for user_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=user_id, text="Server is back online!")
+        except Exception:
+            errors += 1
+    return f"{errors} errors skipped"
+
+
+def with_broadcaster(**kwargs):
+    async def send(bot, chat_ids, scale):
+        broadcaster = broadcast.Broadcaster(
+            bot,
+            rate=kwargs.get("rate", broadcast.BROADCAST_RATE) * scale,
+            chat_rate=broadcast.BROADCAST_CHAT_RATE * scale,
+        )
+        result = await broadcaster.broadcast(chat_ids, "Server is back online!")
+        return f"{len(result.blocked)} blocked users dropped, {result.retries} retries"
+
+    return send
+
+
+async def run(label, sender, args):
+    chat_ids = list(range(1, args.recipients + 1))
+    blocked = set(random.sample(chat_ids, int(len(chat_ids) * args.blocked)))
+    bot = FloodLimitedBot(args.latency / args.scale, args.scale, blocked)
+    started = time.perf_counter()
+    try:
+        note = await sender(bot, chat_ids, args.scale)
+    except Exception as e:
+        note = f"aborted by {type(e).__name__}"
+    elapsed = (time.perf_counter() - started) * args.scale
+    print(
+        f"{label:>12}: {len(bot.sent):>6}/{len(chat_ids)} delivered in "
+        f"{elapsed:7.1f}s, {bot.flood_errors} flood errors ({note})"
+    )
+
+
+async def main(args):
+    logging.getLogger("broadcast").setLevel(logging.ERROR)
+    random.seed(args.seed)
+    print(
+        f"{args.recipients} recipients, {args.blocked:.0%} blocked, "
+        f"{args.latency * 1000:.0f}ms API latency, {TELEGRAM_RATE} msg/s flood limit"
+    )
+    await run("legacy", legacy, args)
+    await run("sequential", sequential, args)
+    await run("unthrottled", with_broadcaster(rate=0), args)
+    await run("broadcaster", with_broadcaster(), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipients", type=int, default=10000)
+    parser.add_argument("--blocked", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--scale", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
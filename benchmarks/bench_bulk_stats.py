@@ -0,0 +1,84 @@
+"""Stats for --names characters: one /getStats per name against one bulk request.
+
+Runs the real handlers against the stub MapleLegends site (--latency per
+request) and a fake Telegram bot (--api-latency per call):
+
+* one_by_one: --names /getStats commands, one after another, the way
+  players compare guild members today
+* bulk: a single /getStats with all the names (albums plus one table)
+* bulk_cached: the same bulk request again, with every character cached
+  and every avatar already uploaded
+
+Printed as JSON: elapsed time, upstream requests, Telegram calls and avatar
+uploads, in total and per name.
+
+Usage: python benchmarks/bench_bulk_stats.py [--names N] [--latency S]
+       [--api-latency S]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import stats_functions  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeContext, FakeUpdate  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+
+async def measure(name, run, names, server, bot):
+    requests, calls, uploads = server.requests, len(bot.sent), bot.uploads
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    requests = server.requests - requests
+    calls = len(bot.sent) - calls
+    return {
+        "scenario": name,
+        "names": len(names),
+        "elapsed_s": round(elapsed, 2),
+        "upstream_requests": requests,
+        "telegram_calls": calls,
+        "avatar_uploads": bot.uploads - uploads,
+        "upstream_requests_per_name": round(requests / len(names), 2),
+        "telegram_calls_per_name": round(calls / len(names), 2),
+    }
+
+
+async def main(args):
+    names = [f"Member{index}" for index in range(args.names)]
+    bot = FakeBot(latency=args.api_latency)
+
+    async def one_by_one():
+        for name in names:
+            await stats_functions.get_stats(
+                FakeUpdate(bot, 1), FakeContext(bot, args=[name])
+            )
+
+    async def bulk():
+        await stats_functions.get_stats(
+            FakeUpdate(bot, 1), FakeContext(bot, args=names)
+        )
+
+    async with StubServer(latency=args.latency) as server:
+        stats_functions.BASE_URL = server.url
+        await http_client.start_http_session()
+        results = [await measure("one_by_one", one_by_one, names, server, bot)]
+        stats_functions.character_cache.clear()
+        results.append(await measure("bulk", bulk, names, server, bot))
+        results.append(await measure("bulk_cached", bulk, names, server, bot))
+        await http_client.close_http_session()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--names", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
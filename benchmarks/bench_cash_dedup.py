@@ -0,0 +1,96 @@
+"""Upstream requests saved by sharing account page results per session id.
+
+Runs one daily cash job against the stub site for --watchers watchers, where
+several Telegram users watch the same session id, then a burst of
+overlapping /getCash and /updateCash style lookups. Reports upstream
+requests made against the number of lookups, which is what the bot used
+to send.
+
+Usage: python benchmarks/bench_cash_dedup.py [--watchers N] [--unique-ids K]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_functions  # noqa: E402
+import http_client  # noqa: E402
+import storage  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeContext  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+from fetch_scheduler import fetch_scheduler  # noqa: E402
+
+
+def watchers(count, unique_ids, seed):
+    rng = random.Random(seed)
+    cash_watchers = {}
+    for index in range(count):
+        user_id = str(index % (count // 2 or 1))
+        account = {
+            "id": str(rng.randrange(unique_ids)),
+            "username": "user",
+            "last_cash": 0,
+            "update_time": "00:00",
+        }
+        cash_watchers.setdefault(user_id, []).append(account)
+    return cash_watchers
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        storage._storage = storage.JsonStorage(
+            os.path.join(directory, "cash_watchers.json"),
+            os.path.join(directory, "watching_users.json"),
+            cash_history_file=os.path.join(directory, "cash_history.json"),
+            rosters_file=os.path.join(directory, "rosters.json"),
+        )
+        async with StubServer(latency=args.latency) as server:
+            cash_functions.BASE_URL = server.url
+            fetch_scheduler.rate_per_host = 0
+            await http_client.start_http_session()
+
+            cash_functions.watchers.load(
+                watchers(args.watchers, args.unique_ids, args.seed)
+            )
+            pairs = len(cash_functions.watchers.at_time("00:00"))
+            context = FakeContext(FakeBot(), job=SimpleNamespace(data="00:00"))
+            started = time.perf_counter()
+            await cash_functions.send_grouped_cash_update(context)
+            elapsed = time.perf_counter() - started
+            print(
+                f"daily job: {pairs} watchers, {server.requests} upstream requests "
+                f"(previously {pairs}) in {elapsed:.2f}s"
+            )
+
+            # Lookups that land together, as when several users run /getCash
+            # or /updateCash for the same accounts
+            cash_functions.cash_cache.clear()
+            server.requests = 0
+            ids = [str(random.randrange(args.unique_ids)) for _ in range(args.burst)]
+            await asyncio.gather(*(cash_functions.get_cash_amount(i) for i in ids))
+            print(
+                f"command burst: {len(ids)} lookups, {server.requests} upstream "
+                f"requests (previously {len(ids)})"
+            )
+            print(f"cash cache: {cash_functions.cash_cache_stats()}")
+            await http_client.close_http_session()
+        storage.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--watchers", type=int, default=2000)
+    parser.add_argument("--unique-ids", type=int, default=800)
+    parser.add_argument("--burst", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""Cost of the cash history: recording a daily run and answering /cashHistory.
+
+Builds a history of --days daily samples for --accounts accounts, then times
+recording one more daily run for all accounts, and answering the 7/30/90
+day summary from the running totals versus scanning every sample of the
+account. Runs against both storage backends in a temporary directory.
+
+Usage: python benchmarks/bench_cash_history.py [--accounts N] [--days D]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_history  # noqa: E402
+import storage  # noqa: E402
+
+START = datetime(2020, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def build(backend, directory, accounts, days):
+    if backend == "sqlite":
+        store = storage.SQLiteStorage(
+            os.path.join(directory, "bench.db"),
+            os.path.join(directory, "none.json"),
+            os.path.join(directory, "none.json"),
+        )
+    else:
+        store = storage.JsonStorage(
+            os.path.join(directory, "cash_watchers.json"),
+            os.path.join(directory, "watching_users.json"),
+            cash_history_file=os.path.join(directory, "cash_history.json"),
+            rosters_file=os.path.join(directory, "rosters.json"),
+        )
+    storage._storage = store
+    cash = {account: random.randint(0, 10000) for account in range(accounts)}
+    for day in range(days):
+        results = []
+        for account in cash:
+            cash[account] += random.randint(0, 400)
+            results.append(("user", {"id": str(account), "last_cash": cash[account]}))
+        cash_history.record_cash_results(
+            results, (START + timedelta(days=day)).timestamp()
+        )
+    return store, cash
+
+
+def full_scan(store, account_id, now):
+    """The same summary computed from every stored sample of the account."""
+    if isinstance(store, storage.SQLiteStorage):
+        rows = store.conn.execute(
+            "SELECT day, cash FROM cash_history "
+            "WHERE user_id = ? AND account_id = ? ORDER BY day",
+            ("user", account_id),
+        ).fetchall()
+    else:
+        rows = [(row[0], row[2]) for row in store._history_rows("user", account_id)]
+    summaries = []
+    for days in cash_history.CASH_HISTORY_PERIODS:
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d")
+        before = [cash for day, cash in rows if day <= cutoff]
+        window = [cash for day, cash in rows if day > cutoff]
+        base = before[-1] if before else rows[0][1]
+        summaries.append((rows[-1][1] - base, sum(window) / len(window)))
+    return summaries
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main(args):
+    random.seed(args.seed)
+    now = START + timedelta(days=args.days)
+    for backend in ("sqlite", "json"):
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            store, cash = build(backend, directory, args.accounts, args.days)
+            build_time = time.perf_counter() - started
+            results = [
+                ("user", {"id": str(account), "last_cash": amount + 100})
+                for account, amount in cash.items()
+            ]
+            record = timed(
+                lambda: cash_history.record_cash_results(results, now.timestamp()), 3
+            )
+            account_id = str(random.randrange(args.accounts))
+            rollup = timed(
+                lambda: cash_history.summarize_cash_history(
+                    "user", account_id, now=now
+                ),
+                args.queries,
+            )
+            scan = timed(lambda: full_scan(store, account_id, now), args.queries)
+            print(
+                f"{backend:>6}: {args.accounts} accounts x {args.days} days built in "
+                f"{build_time:.1f}s, daily run recorded in {record * 1000:.1f} ms, "
+                f"/cashHistory {rollup * 1e6:.0f} us (full scan {scan * 1e6:.0f} us)"
+            )
+            store.close()
+            storage._storage = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+"""Parse time per account page for each cash_parser backend.
+
+Every backend's output is first checked against the original BeautifulSoup
+selectors (the bs4 backend) on every fixture; the script exits non-zero on
+any mismatch.
+
+Usage: python benchmarks/bench_cash_parser.py [--repeat N]
+"""
+
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_parser  # noqa: E402
+from benchmarks.stub_server import FIXTURES_DIR  # noqa: E402
+
+
+def available_backends():
+    backends = ["bs4", "htmlparser"]
+    if importlib.util.find_spec("lxml") is not None:
+        backends.append("lxml")
+    return backends
+
+
+def main(args):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "account*.html"))):
+        with open(path, "r") as f:
+            pages[os.path.basename(path)] = f.read()
+
+    backends = available_backends()
+    mismatches = 0
+    for name, text in pages.items():
+        expected = cash_parser.BACKENDS["bs4"](text)
+        for backend in backends:
+            result = cash_parser.BACKENDS[backend](text)
+            if result != expected:
+                mismatches += 1
+                print(f"MISMATCH {name} [{backend}]: {result!r} != {expected!r}")
+    print(f"checked {len(pages)} fixtures against bs4: {mismatches} mismatches\n")
+
+    print(f"{'fixture':<28}" + "".join(f"{b:>14}" for b in backends))
+    for name, text in pages.items():
+        row = f"{name:<28}"
+        for backend in backends:
+            extract = cash_parser.BACKENDS[backend]
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                extract(text)
+            per_page = (time.perf_counter() - start) / args.repeat
+            row += f"{per_page * 1000:>11.3f} ms"
+        print(row)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    sys.exit(main(parser.parse_args()))
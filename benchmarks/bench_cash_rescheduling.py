@@ -0,0 +1,102 @@
+"""Per-edit cost of cash job scheduling as the number of watchers grows.
+
+For each population size a real python-telegram-bot JobQueue is filled with
+the cash jobs, then a series of /watchCash-style edits (move one watcher to
+another time) is timed with the previous full teardown-and-rebuild and with
+the incremental per-slot update.
+
+Usage: python benchmarks/bench_cash_rescheduling.py [--sizes 100,1000,10000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import Application  # noqa: E402
+
+import cash_functions  # noqa: E402
+from watcher_registry import CashWatcher  # noqa: E402
+
+
+def legacy_schedule_cash_updates(context):
+    """The previous implementation: rebuild every job on each change."""
+    for job in context.job_queue.get_jobs_by_name("cash_update"):
+        job.schedule_removal()
+    update_times = {}
+    for watcher in cash_functions.watchers:
+        update_times.setdefault(watcher.update_time, []).append(watcher)
+    for update_time, accounts in update_times.items():
+        context.job_queue.run_daily(
+            cash_functions.send_grouped_cash_update,
+            time=datetime.strptime(update_time, "%H:%M").time(),
+            name="cash_update",
+            data=accounts,
+        )
+
+
+def populate(size, rng):
+    cash_functions.watchers.clear()
+    for i in range(size):
+        update_time = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+        cash_functions.watchers.add(
+            CashWatcher(str(i // 3), str(i), f"User{i}", 0, update_time)
+        )
+
+
+def move_watcher(rng, population):
+    watcher = rng.choice(population)
+    new_time = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+    return watcher, watcher.update_time, new_time
+
+
+async def measure(application, size, edits, incremental):
+    rng = random.Random(size)
+    populate(size, rng)
+    cash_functions.schedule_cash_updates(application)
+    await asyncio.sleep(0)
+
+    # Pick the edits up front so only scheduling work is timed
+    population = list(cash_functions.watchers)
+    moves = [move_watcher(rng, population) for _ in range(edits)]
+    start = time.perf_counter()
+    for watcher, previous_time, new_time in moves:
+        cash_functions.watchers.set_update_time(watcher, new_time)
+        if incremental:
+            cash_functions.update_cash_slots(application, previous_time, new_time)
+        else:
+            legacy_schedule_cash_updates(application)
+        # Let the job queue process scheduled removals like the bot would
+        await asyncio.sleep(0)
+    return (time.perf_counter() - start) / edits
+
+
+async def main(args):
+    # Only the job queue is started; the bot never talks to Telegram
+    application = Application.builder().token("123456:benchmark").build()
+    await application.job_queue.start()
+    try:
+        print(f"{'watchers':>9} {'full rebuild':>14} {'incremental':>14}")
+        for size in args.sizes:
+            edits = max(5, min(args.edits, 200_000 // size))
+            full = await measure(application, size, edits, incremental=False)
+            incremental = await measure(application, size, args.edits, incremental=True)
+            print(f"{size:>9} {full * 1000:>11.3f} ms {incremental * 1000:>11.3f} ms")
+    finally:
+        await application.job_queue.stop(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[100, 1000, 10000, 50000],
+    )
+    parser.add_argument("--edits", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""Simulated upstream load of the daily cash jobs with and without smoothing.
+
+Builds a synthetic watcher population with a strong preference for round
+times (00:00 above all), plans each update-time group with
+cash_functions.plan_cash_batches and reports peak concurrent upstream
+requests and peak requests started in any one second over the day. Nothing
+is fetched; each request is modelled as taking --fetch-seconds.
+
+Usage: python benchmarks/bench_cash_smoothing.py [--watchers N] [--windows 0,5,15]
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cash_functions import plan_cash_batches  # noqa: E402
+from watcher_registry import CashWatcher  # noqa: E402
+
+
+def synthetic_groups(watchers, seed=1):
+    rng = random.Random(seed)
+    groups = {}
+    user_id = 0
+    created = 0
+    while created < watchers:
+        user_id += 1
+        roll = rng.random()
+        if roll < 0.35:
+            update_time = "00:00"
+        elif roll < 0.5:
+            update_time = "12:00"
+        elif roll < 0.7:
+            update_time = f"{rng.randrange(24):02d}:00"
+        else:
+            update_time = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+        for _ in range(min(rng.randint(1, 5), watchers - created)):
+            watcher = CashWatcher(str(user_id), str(created), "", 0, update_time)
+            groups.setdefault(update_time, []).append(watcher)
+            created += 1
+    return groups
+
+
+def simulate(groups, window_minutes, batch_size, fetch_seconds):
+    events = []
+    starts = Counter()
+    for update_time, accounts in groups.items():
+        hours, minutes = map(int, update_time.split(":"))
+        window = window_minutes * 60
+        job_start = (hours * 3600 + minutes * 60 - window) % 86400
+        for offset, batch in plan_cash_batches(accounts, window, batch_size):
+            start = job_start + offset
+            starts[int(start)] += len(batch)
+            events.append((start, len(batch)))
+            events.append((start + fetch_seconds, -len(batch)))
+
+    peak = current = 0
+    for _, delta in sorted(events):
+        current += delta
+        peak = max(peak, current)
+    return peak, max(starts.values())
+
+
+def main(args):
+    groups = synthetic_groups(args.watchers)
+    print(
+        f"{args.watchers} watchers in {len(groups)} update times, "
+        f"largest group {max(len(a) for a in groups.values())} "
+        f"(batch size {args.batch_size}, {args.fetch_seconds}s per fetch)"
+    )
+    for window in args.windows:
+        peak, peak_starts = simulate(
+            groups, window, args.batch_size, args.fetch_seconds
+        )
+        label = "off" if window == 0 else f"{window} min"
+        print(
+            f"smoothing {label:>7}: peak concurrent {peak:6d}, "
+            f"peak starts/s {peak_starts:6d}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--watchers", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--fetch-seconds", type=float, default=1.5)
+    parser.add_argument(
+        "--windows",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[0, 5, 15, 30],
+    )
+    main(parser.parse_args())
@@ -0,0 +1,138 @@
+"""Cash job completion time with the fetches spread over worker processes.
+
+Runs one send_grouped_cash_update job for --accounts watched accounts
+(distinct session ids) against the stub site, which runs in its own
+process, once per worker count in --workers (0 fetches in the bot process).
+With --kill-after S one worker is killed S seconds into each run to show
+its batches being retried. Reports the job time and the number of
+accounts that ended in an error.
+
+Usage: python benchmarks/bench_cash_workers.py [--accounts N] [--workers 0,1,2,4]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PORT = 8482
+
+
+def run_stub_server(port):
+    from aiohttp import web
+
+    from benchmarks.stub_server import StubServer
+
+    app = StubServer(port=port).make_app()
+    web.run_app(app, port=port, print=None, access_log=None)
+
+
+async def run_job(workers, args, directory):
+    import cash_functions
+    import cash_workers
+    from benchmarks.fakes import FakeBot, FakeContext
+
+    cash_functions.watchers.load(
+        {
+            str(user): [
+                {
+                    "id": f"session-{user}",
+                    "username": "user",
+                    "last_cash": 0,
+                    "update_time": "00:00",
+                }
+            ]
+            for user in range(args.accounts)
+        }
+    )
+    cash_functions.cash_cache.clear()
+    if workers:
+        cash_workers.pool = cash_workers.CashWorkerPool(
+            workers, os.path.join(directory, f"queue-{workers}.db")
+        )
+        await cash_workers.pool.start()
+        # Let the workers import the bot's modules before the clock starts
+        await asyncio.sleep(args.warmup)
+
+    bot = FakeBot()
+    started = time.perf_counter()
+    job = asyncio.ensure_future(
+        cash_functions.send_grouped_cash_update(
+            FakeContext(bot, job=SimpleNamespace(data="00:00"))
+        )
+    )
+    if workers and args.kill_after:
+        await asyncio.sleep(args.kill_after)
+        os.kill(cash_workers.pool.processes[0].pid, signal.SIGKILL)
+    await job
+    elapsed = time.perf_counter() - started
+
+    errors = sum("Error fetching data" in payload for *_, payload in bot.sent)
+    stats = cash_workers.stats()
+    if workers:
+        await cash_workers.stop_cash_workers()
+    return elapsed, errors, stats
+
+
+async def main(args):
+    import http_client
+    import storage
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        storage._storage = storage.SQLiteStorage(
+            os.path.join(directory, "bench.db"),
+            os.path.join(directory, "none.json"),
+            os.path.join(directory, "none.json"),
+        )
+        await http_client.start_http_session()
+        print(f"{args.accounts} accounts, {os.cpu_count()} CPUs")
+        for workers in args.workers:
+            elapsed, errors, stats = await run_job(workers, args, directory)
+            line = (
+                f"workers={workers}: {elapsed:.1f}s "
+                f"({args.accounts / elapsed:.0f} accounts/s), {errors} errors"
+            )
+            if workers:
+                line += f", {stats['restarts']} restarts"
+            print(line)
+        await http_client.close_http_session()
+        storage.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=50000)
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[0, 1, 2, 4],
+    )
+    parser.add_argument("--kill-after", type=float, default=0)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    # Read by the bot's modules at import time, here and in the workers
+    os.environ["MAPLELEGENDS_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+    os.environ["FETCH_RATE_PER_HOST"] = "0"
+    os.environ["FETCH_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["CASH_CACHE_TTL"] = "0"
+
+    stub = multiprocessing.get_context("spawn").Process(
+        target=run_stub_server, args=(STUB_PORT,), daemon=True
+    )
+    stub.start()
+    time.sleep(2)
+    try:
+        asyncio.run(main(args))
+    finally:
+        stub.terminate()
@@ -0,0 +1,110 @@
+"""Event-loop responsiveness while many /getStats calls are in flight.
+
+A ticker coroutine stands in for "other handlers": it wakes every few
+milliseconds and records how late it was. With a blocking fetch the lag grows
+to the length of every upstream round-trip; with the async pipeline it stays
+near zero.
+
+Usage: python benchmarks/bench_get_stats.py [--calls N] [--latency S]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import stats_functions  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeContext, FakeUpdate  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+TICK = 0.005
+
+
+async def ticker(stop, lags):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def blocking_get_stats(update, context):
+    """The previous implementation: two sequential blocking requests.
+
+    It used ``requests``; urllib blocks the loop the same way and keeps the
+    benchmark free of that dependency.
+    """
+    name = context.args[0]
+    with urlopen(f"{stats_functions.BASE_URL}/api/character?name={name}") as response:
+        data = json.load(response)
+    with urlopen(f"{stats_functions.BASE_URL}/api/getavatar?name={name}") as response:
+        avatar = response.read()
+    await update.message.reply_photo(
+        photo=avatar, caption=stats_functions.format_stats_message(data)
+    )
+
+
+async def measure(handler, calls):
+    bot = FakeBot()
+    stop = asyncio.Event()
+    lags = []
+    tick_task = asyncio.create_task(ticker(stop, lags))
+
+    async def one(i):
+        update = FakeUpdate(bot, i, "/getStats")
+        await handler(update, FakeContext(bot, args=[f"Char{i}"]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(calls)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    return elapsed, lags, len(bot.sent)
+
+
+def report(label, elapsed, lags, replies):
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    print(
+        f"{label:>10}: {replies} replies in {elapsed:.2f}s | ticker lag "
+        f"median {statistics.median(lags_ms):.1f}ms, max {lags_ms[-1]:.1f}ms"
+    )
+
+
+async def main(args):
+    # The stub runs on its own thread so blocking calls here can't stall it
+    server = StubServer(latency=args.latency)
+    server_loop = asyncio.new_event_loop()
+
+    def serve():
+        asyncio.set_event_loop(server_loop)
+        server_loop.run_until_complete(server.start())
+        server_loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    while not server.port:
+        await asyncio.sleep(0.01)
+    stats_functions.BASE_URL = server.url
+
+    await http_client.start_http_session()
+    try:
+        if not args.skip_blocking:
+            report("blocking", *await measure(blocking_get_stats, args.calls))
+        report("async", *await measure(stats_functions.get_stats, args.calls))
+    finally:
+        await http_client.close_http_session()
+        server_loop.call_soon_threadsafe(server_loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--skip-blocking", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""Requests/sec for fetch_cash_amount with per-call sessions vs the shared pool.
+
+The stub speaks plain HTTP, so the gap against the real site (TLS handshake
+per new connection) is larger than what is measured here.
+
+Usage: python benchmarks/bench_http_session.py [--requests N] [--concurrency C]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_functions  # noqa: E402
+import http_client  # noqa: E402
+from fetch_scheduler import fetch_scheduler  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+
+async def run_batch(total, concurrency, fetch):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await fetch(str(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    return time.perf_counter() - start
+
+
+async def per_call_session(session_id):
+    async with aiohttp.ClientSession() as session:
+        await cash_functions.fetch_cash_amount(session_id, session)
+
+
+async def shared_session(session_id):
+    await cash_functions.fetch_cash_amount(session_id)
+
+
+async def main(args):
+    async with StubServer(latency=args.latency) as server:
+        cash_functions.BASE_URL = server.url
+        # Measure the pool itself, not the production rate limit
+        fetch_scheduler.rate_per_host = 0
+        fetch_scheduler.max_concurrency = args.concurrency
+
+        for label, fetch in (
+            ("per-call session", per_call_session),
+            ("shared session", shared_session),
+        ):
+            server.requests = 0
+            server._connections.clear()
+            await http_client.start_http_session()
+            elapsed = await run_batch(args.requests, args.concurrency, fetch)
+            await http_client.close_http_session()
+            print(
+                f"{label:>18}: {args.requests / elapsed:8.1f} req/s "
+                f"({elapsed:.2f}s, {server.connections} connections)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
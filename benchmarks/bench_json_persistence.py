@@ -0,0 +1,82 @@
+"""Disk writes and event-loop stalls for a burst of commands on the JSON backend.
+
+Replays a burst of /watchCash-style changes against JsonStorage from inside
+an event loop and compares it with the previous behaviour of rewriting the
+whole file synchronously on every command.
+
+Usage: python benchmarks/bench_json_persistence.py [--commands N] [--watchers W]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from benchmarks.bench_storage import make_watchers  # noqa: E402
+
+
+async def burst(save, commands, watchers):
+    users = list(watchers)
+    stalls = []
+    start = time.perf_counter()
+    for i in range(commands):
+        user_id = users[i % len(users)]
+        entry = dict(watchers[user_id][0], last_cash=i)
+        call_start = time.perf_counter()
+        save(user_id, entry)
+        stalls.append(time.perf_counter() - call_start)
+        # Yield like a handler would between commands
+        await asyncio.sleep(0)
+    return time.perf_counter() - start, max(stalls)
+
+
+async def main(args):
+    watchers = make_watchers(args.watchers)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cash_watchers.json")
+        with open(path, "w") as f:
+            json.dump(watchers, f)
+
+        writes = 0
+
+        def save_sync(user_id, entry):
+            nonlocal writes
+            watchers[user_id][0] = entry
+            with open(path, "w") as f:
+                json.dump(watchers, f)
+            writes += 1
+
+        elapsed, stall = await burst(save_sync, args.commands, watchers)
+        print(
+            f"  synchronous: {writes:5d} writes, burst {elapsed:.2f}s, "
+            f"max loop stall {stall * 1000:.2f} ms"
+        )
+
+        users_path = os.path.join(directory, "users.json")
+        store = storage.JsonStorage(path, users_path, args.interval)
+        store.load_cash_watchers()
+        elapsed, stall = await burst(store.save_cash_watcher, args.commands, watchers)
+        store.close()
+        print(
+            f"write-behind: {store.cash_watchers_writer.writes:5d} writes, "
+            f"burst {elapsed:.2f}s, max loop stall {stall * 1000:.2f} ms "
+            f"(interval {args.interval}s, flushed on close)"
+        )
+        # The flushed file must hold the last change of the burst
+        last_user = list(watchers)[(args.commands - 1) % len(watchers)]
+        with open(path) as f:
+            assert json.load(f)[last_user][0]["last_cash"] == args.commands - 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--commands", type=int, default=1000)
+    parser.add_argument("--watchers", type=int, default=10000)
+    parser.add_argument("--interval", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Overhead of the metrics instrumentation.
+
+Times the recording primitives, a trivial command handler with and without
+instrument_handler, requests to the stub site on a session with and without
+the upstream trace config, and rendering /metrics.
+
+Usage: python benchmarks/bench_metrics.py [--iterations N] [--requests N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+
+import metrics  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+
+def per_call(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations
+
+
+async def per_call_async(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await function(None, None)
+    return (time.perf_counter() - started) / iterations
+
+
+async def request_rate(url, total, trace):
+    trace_configs = [metrics.upstream_trace_config()] if trace else []
+    async with aiohttp.ClientSession(trace_configs=trace_configs) as session:
+
+        async def one():
+            async with session.get(url) as response:
+                await response.read()
+
+        started = time.perf_counter()
+        for _ in range(total // 20):
+            await asyncio.gather(*(one() for _ in range(20)))
+        return total / (time.perf_counter() - started)
+
+
+async def main(args):
+    histogram = metrics.Histogram("bench_seconds", "Benchmark", ["label"])
+    counter = metrics.Counter("bench_total", "Benchmark", ["label"])
+    observe = per_call(lambda: histogram.observe(0.042, "a"), args.iterations)
+    inc = per_call(lambda: counter.inc("a", "200"), args.iterations)
+    print(f"histogram observe: {observe * 1e9:.0f} ns, counter inc: {inc * 1e9:.0f} ns")
+
+    async def handler(update, context):
+        return None
+
+    bare = await per_call_async(handler, args.iterations)
+    wrapped = await per_call_async(
+        metrics.instrument_handler("bench", handler), args.iterations
+    )
+    print(
+        f"handler call: {bare * 1e9:.0f} ns bare, {wrapped * 1e9:.0f} ns instrumented"
+    )
+
+    async with StubServer() as server:
+        url = f"{server.url}/api/get_online_users"
+        await request_rate(url, 200, False)
+        plain = await request_rate(url, args.requests, False)
+        traced = await request_rate(url, args.requests, True)
+    print(f"stub requests: {plain:.0f} req/s untraced, {traced:.0f} req/s traced")
+
+    # A realistic number of series: every command, endpoint and status
+    for command in range(15):
+        for _ in range(10):
+            metrics.handler_duration.observe(0.1, f"command{command}")
+    for endpoint in range(5):
+        for status in (200, 500, 503, "TimeoutError"):
+            metrics.upstream_responses.inc(f"/endpoint{endpoint}", status)
+            metrics.upstream_duration.observe(0.2, f"/endpoint{endpoint}")
+    text = metrics.render()
+    render_time = per_call(metrics.render, 100)
+    print(
+        f"render: {render_time * 1000:.2f} ms for {len(text.splitlines())} lines "
+        f"({len(text) / 1024:.0f} KiB)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""Cash page parsing throughput per executor mode and worker count.
+
+Parses a batch of saved account pages (fixtures with varied usernames and
+cash values) through parse_account_page_async, the way a cash_update job
+does once responses arrive, and reports pages/sec.
+
+Usage: python benchmarks/bench_parse_executor.py [--pages N] [--backend B]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_parser  # noqa: E402
+from benchmarks.stub_server import load_fixture  # noqa: E402
+
+
+def make_pages(count):
+    template = load_fixture("account.html")
+    return [
+        template.replace("Luisotee", f"User{i}").replace("123,456", f"{i * 37:,}")
+        for i in range(count)
+    ]
+
+
+async def run(pages, backend):
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[cash_parser.parse_account_page_async(page, backend) for page in pages]
+    )
+    elapsed = time.perf_counter() - start
+    assert results[-1] == (f"User{len(pages) - 1}", (len(pages) - 1) * 37)
+    return elapsed
+
+
+def worker_counts(limit):
+    count = 1
+    while count < limit:
+        yield count
+        count *= 2
+    yield limit
+
+
+async def main(args):
+    pages = make_pages(args.pages)
+    modes = [("inline", 1)]
+    modes += [("process", n) for n in worker_counts(args.max_workers)]
+    if args.backend == "lxml":
+        modes += [("thread", n) for n in worker_counts(args.max_workers)]
+
+    print(f"{args.pages} pages, backend={args.backend}, {os.cpu_count()} CPUs")
+    for mode, workers in modes:
+        cash_parser.configure_parse_executor(mode, workers)
+        # Warm up so pool start-up isn't part of the measurement
+        await run(pages[: workers * 2], args.backend)
+        elapsed = await run(pages, args.backend)
+        cash_parser.shutdown_parse_executor()
+        print(
+            f"{mode:>8} x{workers:<3}: {args.pages / elapsed:8.1f} pages/s "
+            f"({elapsed:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--backend", default=cash_parser.CASH_PARSER)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""Cost of the profiling hooks when off and when on.
+
+Times a trivial callback and span with the hooks disabled, then runs the
+daily cash job against the stub site with profiling off, on with spans only,
+and on with a cProfile capture and dump, printing the slow-job log line.
+
+Usage: python benchmarks/bench_profiling.py [--watchers N] [--iterations N]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cash_functions  # noqa: E402
+import http_client  # noqa: E402
+import profiling  # noqa: E402
+import storage  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeContext  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+from fetch_scheduler import fetch_scheduler  # noqa: E402
+
+
+async def per_call(callback, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await callback(None, None)
+    return (time.perf_counter() - started) / iterations
+
+
+async def run_job(watchers, bot):
+    cash_functions.cash_cache.clear()
+    cash_functions.watchers.load(
+        {
+            str(index): [
+                {
+                    "id": str(index),
+                    "username": "user",
+                    "last_cash": 0,
+                    "update_time": "00:00",
+                }
+            ]
+            for index in range(watchers)
+        }
+    )
+    job = profiling.profiled("cash_update", cash_functions.send_grouped_cash_update)
+    started = time.perf_counter()
+    await job(FakeContext(bot, job=SimpleNamespace(data="00:00")))
+    return time.perf_counter() - started
+
+
+async def main(args):
+    logging.basicConfig(level=logging.WARNING, format="  %(message)s")
+
+    async def callback(update, context):
+        with profiling.span("stage"):
+            return None
+
+    profiling.set_enabled(False)
+    bare = await per_call(callback, args.iterations)
+    wrapped = await per_call(
+        profiling.profiled("bench", callback), args.iterations
+    )
+    print(
+        f"profiling off: callback with one span {bare * 1e9:.0f} ns, "
+        f"wrapped {wrapped * 1e9:.0f} ns"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        profiling.PROFILE_DIR = os.path.join(directory, "profiles")
+        storage._storage = storage.JsonStorage(
+            os.path.join(directory, "cash_watchers.json"),
+            os.path.join(directory, "watching_users.json"),
+            cash_history_file=os.path.join(directory, "cash_history.json"),
+            rosters_file=os.path.join(directory, "rosters.json"),
+        )
+        async with StubServer(latency=args.latency) as server:
+            cash_functions.BASE_URL = server.url
+            fetch_scheduler.rate_per_host = 0
+            await http_client.start_http_session()
+            bot = FakeBot(latency=args.latency / 5)
+            await run_job(args.watchers, bot)
+
+            for label, on, threshold in (
+                ("off", False, float("inf")),
+                ("spans only", True, float("inf")),
+                ("spans + cProfile dump", True, 0),
+            ):
+                profiling.set_enabled(on)
+                profiling.PROFILE_THRESHOLD = threshold
+                elapsed = await run_job(args.watchers, bot)
+                print(f"cash job, profiling {label}: {elapsed:.2f}s")
+            await http_client.close_http_session()
+        storage.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--watchers", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""Cost of the online count history and the flaps its hysteresis prevents.
+
+Fills an OnlineHistory with a week of readings and reports its memory use
+against a list of tuples, append throughput and windowed query times. Then
+replays a week of simulated readings, with occasional single bad readings
+and two real outages, through the old single-threshold rule and through
+check_server_status, counting the alerts each would send.
+
+Usage: python benchmarks/bench_server_history.py [--glitch-rate P]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telegramBot  # noqa: E402
+from benchmarks.fakes import FakeApplication, FakeBot  # noqa: E402
+from broadcast import Broadcaster  # noqa: E402
+from server_history import SERVER_HISTORY_SIZE, OnlineHistory  # noqa: E402
+from server_monitor import OFFLINE_THRESHOLD  # noqa: E402
+
+WEEK = 7 * 86400
+
+
+def memory(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def simulated_week(glitch_rate, interval=60):
+    """Readings every ``interval`` seconds with glitches and two outages."""
+    outages = [(2 * 86400, 2 * 86400 + 900), (5 * 86400, 5 * 86400 + 1800)]
+    readings = []
+    for timestamp in range(0, WEEK, interval):
+        if any(start <= timestamp < end for start, end in outages):
+            count = random.randint(0, 3)
+        elif random.random() < glitch_rate:
+            count = 0
+        else:
+            count = random.randint(1200, 1800)
+        readings.append((timestamp, count))
+    return readings
+
+
+def legacy_alerts(readings):
+    alerts, offline = 0, False
+    for _, count in readings:
+        if (count < OFFLINE_THRESHOLD) != offline:
+            offline = not offline
+            alerts += 1
+    return alerts
+
+
+async def hysteresis_alerts(readings):
+    bot = FakeBot()
+    application = FakeApplication(bot)
+    telegramBot.watching_users = {1}
+    telegramBot.is_server_offline = False
+    telegramBot.broadcaster = Broadcaster(bot, rate=0, chat_rate=0)
+    telegramBot.online_history = OnlineHistory(1000)
+    for timestamp, count in readings:
+        telegramBot.online_history.append(count, timestamp)
+        await telegramBot.check_server_status(application, count)
+        await asyncio.sleep(0)
+    await asyncio.gather(*application.tasks)
+    return len(bot.sent)
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+    now = time.time()
+    samples = [(now - WEEK + i * 10, random.randint(0, 2000)) for i in range(60480)]
+
+    def fill():
+        history = OnlineHistory(SERVER_HISTORY_SIZE)
+        for timestamp, count in samples:
+            history.append(count, timestamp)
+        return history
+
+    history, history_bytes = memory(fill)
+    _, list_bytes = memory(lambda: [(t, c) for t, c in samples])
+    print(
+        f"{len(samples)} readings (a week at 10s): ring buffer "
+        f"{history_bytes / 1024:.0f} KiB, list of tuples {list_bytes / 1024:.0f} KiB"
+    )
+
+    started = time.perf_counter()
+    for timestamp, count in samples:
+        history.append(count, timestamp)
+    elapsed = time.perf_counter() - started
+    print(f"append: {elapsed / len(samples) * 1e9:.0f} ns per reading")
+
+    for label, seconds in (("1h", 3600), ("24h", 86400), ("7d", WEEK)):
+        started = time.perf_counter()
+        for _ in range(args.queries):
+            history.stats(seconds, now)
+            history.sparkline(seconds, now=now)
+        elapsed = (time.perf_counter() - started) / args.queries
+        print(f"stats + sparkline over {label:>3}: {elapsed * 1000:7.2f} ms")
+
+    readings = simulated_week(args.glitch_rate)
+    print(
+        f"a week of 60s readings with {args.glitch_rate:.1%} glitches and 2 outages: "
+        f"single threshold sends {legacy_alerts(readings)} alerts, "
+        f"hysteresis sends {await hysteresis_alerts(readings)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--glitch-rate", type=float, default=0.005)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
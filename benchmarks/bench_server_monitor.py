@@ -0,0 +1,114 @@
+"""Outage detection-to-notification latency against the stub API.
+
+The stub's online count is dropped to zero at a random point and the time
+until the watcher is told the server is offline is measured. The previous
+design (a polling thread plus a separate status-check job, each on its own
+interval) is compared with ServerMonitor, which pushes each reading straight
+into the notification logic. Both need STATUS_CONFIRM_SAMPLES low readings
+before alerting. Intervals are scaled down by --scale so a run takes
+seconds; reported latencies are scaled back up to production values.
+
+Usage: python benchmarks/bench_server_monitor.py [--trials N] [--scale S]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import server_monitor  # noqa: E402
+import telegramBot  # noqa: E402
+from benchmarks.fakes import FakeApplication, FakeBot  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+from broadcast import Broadcaster  # noqa: E402
+from server_history import OnlineHistory  # noqa: E402
+
+
+async def wait_for_alert(bot):
+    while not bot.sent:
+        await asyncio.sleep(0.001)
+    return bot.sent[0][0]
+
+
+async def legacy(bot, interval):
+    """Poll into a shared value; check it on an independent timer."""
+    shared = {"count": 0}
+
+    async def poller():
+        while True:
+            data = await server_monitor.get_online_users()
+            shared["count"] = data.get("usercount", 0)
+            telegramBot.online_history.append(shared["count"])
+            await asyncio.sleep(interval)
+
+    async def checker():
+        # The job queue's timer is not aligned with the polling thread
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            await telegramBot.check_server_status(
+                FakeApplication(bot), shared["count"]
+            )
+            await asyncio.sleep(interval)
+
+    return [asyncio.create_task(poller()), asyncio.create_task(checker())]
+
+
+async def adaptive(bot, interval):
+    monitor = server_monitor.ServerMonitor(
+        partial(telegramBot.check_server_status, FakeApplication(bot)),
+        interval=interval,
+        unhealthy_interval=interval / 6,
+        history=telegramBot.online_history,
+    )
+    monitor.start()
+    return [monitor._task]
+
+
+async def trial(server, start_tasks, interval):
+    bot = FakeBot()
+    telegramBot.watching_users = {1}
+    telegramBot.is_server_offline = False
+    telegramBot.broadcaster = Broadcaster(bot)
+    telegramBot.online_history = OnlineHistory(1000)
+    server.online_users = 1500
+    tasks = await start_tasks(bot, interval)
+    await asyncio.sleep(random.uniform(interval, 2 * interval))
+    server.online_users = 0
+    outage_at = time.perf_counter()
+    alerted_at = await wait_for_alert(bot)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return alerted_at - outage_at
+
+
+async def main(args):
+    interval = 60 / args.scale
+    async with StubServer() as server:
+        server_monitor.BASE_URL = server.url
+        await http_client.start_http_session()
+        for label, start_tasks in (("legacy", legacy), ("monitor", adaptive)):
+            latencies = [
+                await trial(server, start_tasks, interval) * args.scale
+                for _ in range(args.trials)
+            ]
+            print(
+                f"{label:>8}: detection-to-notification median "
+                f"{statistics.median(latencies):6.1f}s, max {max(latencies):6.1f}s "
+                f"(60s poll interval)"
+            )
+        await http_client.close_http_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--scale", type=float, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,196 @@
+"""Cold start: import time, time to first reply and memory at idle.
+
+Starts the bot the way the container does (``python main.py``) in a fresh
+process against a local stub of the Telegram Bot API (``TELEGRAM_BASE_URL``)
+and the stub MapleLegends site, with --watchers cash watchers in a new
+SQLite database. Two updates are already waiting when the bot first polls:
+/help, which needs nothing but Telegram, and /removeCashWatcher from a user
+with watchers, which can only be answered once the watchers are loaded.
+
+Printed as JSON for each watcher count, medians of --runs starts:
+
+* import_ms: importing telegramBot in a fresh interpreter
+* first_reply_s: process start until the /help reply reaches the stub
+* state_reply_s: process start until the /removeCashWatcher reply
+* idle_rss_mb: resident memory --idle seconds after both replies (Linux)
+
+--bot-dir runs another checkout instead, for example a git worktree of an
+older commit.
+
+Usage: python benchmarks/bench_startup.py [--watchers 0,100000] [--runs N]
+       [--bot-dir DIR] [--api-latency S]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_update_modes import TOKEN, StubBotApi  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+HELP_CHAT = 1001
+STATE_CHAT = 1002
+
+
+def import_ms(bot_dir):
+    """Cumulative import time of telegramBot reported by -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import telegramBot"],
+        cwd=bot_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    line = [line for line in result.stderr.splitlines() if line.endswith("telegramBot")]
+    return int(line[-1].split("|")[1]) / 1000
+
+
+def seed_database(path, count):
+    store = SQLiteStorage(
+        path,
+        cash_watchers_file=os.path.join(os.path.dirname(path), "none.json"),
+        users_file=os.path.join(os.path.dirname(path), "none.json"),
+    )
+    rows = [
+        (
+            str(STATE_CHAT if index < 3 else 10_000 + index // 3),
+            f"{index:032x}",
+            f"Player{index}",
+            index,
+            f"{index % 1440 // 60:02d}:{index % 60:02d}",
+        )
+        for index in range(max(count, 3))
+    ]
+    with store.conn:
+        store.conn.executemany(store._UPSERT_WATCHER, rows)
+        store.conn.executemany(
+            "INSERT INTO watching_users (user_id) VALUES (?)",
+            [(10_000 + index,) for index in range(count // 10)],
+        )
+    store.close()
+
+
+def command(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+            "entities": [
+                {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+            ],
+        },
+    }
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def start_once(args, site_url, directory):
+    # A fresh stub per start: a killed bot's long poll may still be waiting
+    api = StubBotApi(latency=args.api_latency)
+    await api.start()
+    api.pending.put_nowait(command(1, HELP_CHAT, "/help"))
+    api.pending.put_nowait(command(2, STATE_CHAT, "/removeCashWatcher nobody"))
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_BASE_URL=api.url,
+        MAPLELEGENDS_URL=site_url,
+        DATABASE_FILE=os.path.join(directory, "maplelegends.db"),
+        CASH_WATCHERS_FILE=os.path.join(directory, "none.json"),
+        USERS_FILE=os.path.join(directory, "none.json"),
+        METRICS_PORT="0",
+    )
+    with open(os.path.join(directory, "bot.log"), "w") as log:
+        started = time.perf_counter()
+        deadline = started + 120
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            os.path.join(args.bot_dir, "main.py"),
+            cwd=directory,
+            env=env,
+            stdout=log,
+            stderr=log,
+        )
+        try:
+            while len(api.replies) < 2:
+                if process.returncode is not None or time.perf_counter() > deadline:
+                    raise RuntimeError(f"bot did not reply, see {log.name}")
+                await asyncio.sleep(0.005)
+            await asyncio.sleep(args.idle)
+            rss = rss_mb(process.pid)
+        finally:
+            if process.returncode is None:
+                process.terminate()
+            await process.wait()
+            await api.stop()
+    return {
+        "first_reply_s": api.replies[HELP_CHAT] - started,
+        "state_reply_s": api.replies[STATE_CHAT] - started,
+        "idle_rss_mb": rss,
+    }
+
+
+def median(runs, key):
+    values = [run[key] for run in runs if run[key] is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+async def main(args):
+    results = []
+    async with StubServer() as site:
+        for count in [int(value) for value in args.watchers.split(",")]:
+            with tempfile.TemporaryDirectory() as directory:
+                seed_database(os.path.join(directory, "maplelegends.db"), count)
+                runs = [
+                    await start_once(args, site.url, directory)
+                    for _ in range(args.runs)
+                ]
+            results.append(
+                {
+                    "watchers": count,
+                    "import_ms": round(
+                        statistics.median(
+                            import_ms(args.bot_dir) for _ in range(args.runs)
+                        ),
+                        1,
+                    ),
+                    "first_reply_s": median(runs, "first_reply_s"),
+                    "state_reply_s": median(runs, "state_reply_s"),
+                    "idle_rss_mb": median(runs, "idle_rss_mb"),
+                }
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--watchers", default="0,100000")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--bot-dir", default=ROOT)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--idle", type=float, default=3)
+    asyncio.run(main(parser.parse_args()))
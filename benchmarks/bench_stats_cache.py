@@ -0,0 +1,58 @@
+"""Upstream requests and uploads saved by the /getStats character cache.
+
+Fires bursts of concurrent /getStats calls for a small set of popular names
+and reports how many upstream requests and avatar uploads were made, along
+with the cache counters.
+
+Usage: python benchmarks/bench_stats_cache.py [--calls N] [--names K]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import stats_functions  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeContext, FakeUpdate  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+
+async def main(args):
+    async with StubServer(latency=args.latency) as server:
+        stats_functions.BASE_URL = server.url
+        await http_client.start_http_session()
+        bot = FakeBot()
+
+        async def one(i):
+            name = f"Popular{i % args.names}"
+            # Mix the case to show keys are normalised
+            name = name.upper() if i % 2 else name
+            update = FakeUpdate(bot, i, "/getStats")
+            await stats_functions.get_stats(update, FakeContext(bot, args=[name]))
+
+        start = time.perf_counter()
+        for burst in range(args.bursts):
+            await asyncio.gather(
+                *[one(burst * args.calls + i) for i in range(args.calls)]
+            )
+        elapsed = time.perf_counter() - start
+        await http_client.close_http_session()
+
+        print(f"{args.bursts * args.calls} /getStats calls in {elapsed:.2f}s")
+        uncached = 2 * args.bursts * args.calls
+        print(f"upstream requests: {server.requests} (uncached: {uncached})")
+        print(f"photos sent: {len(bot.sent)}, avatar uploads: {bot.uploads}")
+        print(f"cache: {stats_functions.character_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--names", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
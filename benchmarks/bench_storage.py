@@ -0,0 +1,97 @@
+"""Per-command write latency of the storage backends by watcher count.
+
+For each population size both backends are filled with synthetic watchers,
+then single-watcher writes (what /watchCash does) and a batched cash result
+write for 1,000 watchers (what a cash_update job does) are timed.
+
+Usage: python benchmarks/bench_storage.py [--sizes 100,10000,100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+def make_watchers(size):
+    return {
+        str(user): [
+            {
+                "id": f"{user}-{n}",
+                "username": f"User{user}x{n}",
+                "last_cash": user * 10 + n,
+                "update_time": f"{user % 24:02d}:{n * 10:02d}",
+            }
+            for n in range(3)
+        ]
+        for user in range(size // 3)
+    }
+
+
+def open_backend(backend, directory, watchers):
+    cash_file = os.path.join(directory, "cash_watchers.json")
+    users_file = os.path.join(directory, "watching_users.json")
+    with open(cash_file, "w") as f:
+        json.dump(watchers, f)
+    with open(users_file, "w") as f:
+        json.dump([], f)
+    if backend == "json":
+        store = storage.JsonStorage(cash_file, users_file)
+    else:
+        # The database is created by migrating the JSON file
+        store = storage.SQLiteStorage(
+            os.path.join(directory, "bench.db"), cash_file, users_file
+        )
+    store.load_cash_watchers()
+    return store
+
+
+def measure(store, watchers, writes):
+    users = list(watchers)
+    start = time.perf_counter()
+    for i in range(writes):
+        entry = dict(watchers[users[i % len(users)]][0], last_cash=i)
+        store.save_cash_watcher(users[i % len(users)], entry)
+    single = (time.perf_counter() - start) / writes
+
+    batch = [
+        (user, dict(watchers[user][0], last_cash=1)) for user in users[:1000]
+    ]
+    start = time.perf_counter()
+    store.save_cash_results(batch)
+    return single, time.perf_counter() - start
+
+
+def main(args):
+    print(f"{'watchers':>9} {'backend':>8} {'per command':>14} {'job batch':>12}")
+    for size in args.sizes:
+        watchers = make_watchers(size)
+        for backend in ("json", "sqlite"):
+            with tempfile.TemporaryDirectory() as directory:
+                store = open_backend(backend, directory, watchers)
+                writes = (
+                    args.writes if backend == "sqlite" else max(3, args.writes // 10)
+                )
+                single, batch = measure(store, watchers, writes)
+                store.close()
+            print(
+                f"{size:>9} {backend:>8} {single * 1000:>11.3f} ms "
+                f"{batch * 1000:>9.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[100, 10000, 100000],
+    )
+    parser.add_argument("--writes", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,232 @@
+"""Update-to-reply latency with long polling and with the webhook.
+
+Builds the bot's real Application against a local stub of the Telegram Bot
+API (via ``base_url``) and the stub MapleLegends site, then feeds it a
+stream of synthetic /help and /getStats updates at --rate per second. In
+polling mode the updates are handed out by the stub's getUpdates; in
+webhook mode they are POSTed to webhook.py's server with the secret token.
+Latency is measured from the moment an update is offered until the stub
+API receives the reply. --api-latency is added to every Bot API call to
+model the round trip to Telegram.
+
+Usage: python benchmarks/bench_update_modes.py [--updates N] [--rate R]
+       [--concurrent-updates N] [--api-latency S]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import http_client  # noqa: E402
+import stats_functions  # noqa: E402
+import telegramBot  # noqa: E402
+import webhook  # noqa: E402
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+
+
+class StubBotApi:
+    """Answers the Bot API calls the bot makes and records reply times."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.pending = asyncio.Queue()
+        self.replies = {}
+        self.message_ids = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    def message(self, chat_id, **extra):
+        return dict(
+            message_id=next(self.message_ids),
+            date=int(time.time()),
+            chat={"id": chat_id, "type": "private"},
+            **extra,
+        )
+
+    async def get_updates(self, params):
+        updates = [await self.pending.get()] if self.pending.empty() else []
+        while not self.pending.empty():
+            updates.append(self.pending.get_nowait())
+        offset = int(params.get("offset") or 0)
+        return [update for update in updates if update["update_id"] >= offset]
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            result = {
+                "id": 123456,
+                "is_bot": True,
+                "first_name": "Bench",
+                "username": "bench_bot",
+            }
+        elif method == "getUpdates":
+            try:
+                result = await asyncio.wait_for(
+                    self.get_updates(params), float(params.get("timeout") or 0) or 1
+                )
+            except asyncio.TimeoutError:
+                result = []
+        elif method in ("sendMessage", "sendPhoto"):
+            chat_id = int(params["chat_id"])
+            self.replies.setdefault(chat_id, time.perf_counter())
+            extra = {"text": "ok"}
+            if method == "sendPhoto":
+                extra = {
+                    "photo": [
+                        {
+                            "file_id": "avatar",
+                            "file_unique_id": "avatar",
+                            "width": 96,
+                            "height": 96,
+                        }
+                    ]
+                }
+            result = self.message(chat_id, **extra)
+        else:
+            # deleteWebhook, setWebhook and anything else that returns True
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/bot"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def make_update(update_id, names):
+    # Every update comes from its own chat so replies map back to updates
+    chat_id = 1000 + update_id
+    if update_id % 2:
+        text = f"/getStats char{update_id % names}"
+    else:
+        text = "/help"
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+async def run_mode(mode, args, api):
+    api.replies.clear()
+    application = telegramBot.build_application(TOKEN, mode=mode, base_url=api.url)
+    # The real post_init would start the server monitor and metrics server
+    application.post_init = None
+    application.post_shutdown = None
+    await application.initialize()
+    session = None
+    if mode == "webhook":
+        runner = await webhook.start_webhook_server(
+            application, SECRET, "127.0.0.1", args.webhook_port, "/telegram"
+        )
+        session = aiohttp.ClientSession()
+        webhook_url = f"http://127.0.0.1:{args.webhook_port}/telegram"
+        # A request without the secret token must be turned away
+        async with session.post(webhook_url, json=make_update(0, 1)) as response:
+            assert response.status == 403, response.status
+    else:
+        await application.updater.start_polling(
+            poll_interval=0, timeout=10, allowed_updates=telegramBot.ALLOWED_UPDATES
+        )
+    await application.start()
+
+    offered = {}
+
+    async def offer(update):
+        chat_id = update["message"]["chat"]["id"]
+        offered[chat_id] = time.perf_counter()
+        if mode == "webhook":
+            headers = {webhook.SECRET_TOKEN_HEADER: SECRET}
+            async with session.post(webhook_url, json=update, headers=headers) as r:
+                assert r.status == 200, r.status
+        else:
+            api.pending.put_nowait(update)
+
+    started = time.perf_counter()
+    posts = []
+    for update_id in range(1, args.updates + 1):
+        posts.append(asyncio.ensure_future(offer(make_update(update_id, args.names))))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*posts)
+    while len(api.replies) < args.updates and time.perf_counter() - started < 120:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(api.replies[chat] - offered[chat] for chat in api.replies)
+    if mode == "webhook":
+        await session.close()
+        await runner.cleanup()
+    else:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return {
+        "mode": mode,
+        "updates": args.updates,
+        "replies": len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    telegramBot.CONCURRENT_UPDATES = args.concurrent_updates
+    api = StubBotApi(latency=args.api_latency)
+    await api.start()
+    async with StubServer(latency=args.upstream_latency) as server:
+        stats_functions.BASE_URL = server.url
+        await http_client.start_http_session()
+        results = []
+        for mode in args.modes.split(","):
+            stats_functions.character_cache.clear()
+            results.append(await run_mode(mode, args, api))
+        await http_client.close_http_session()
+    await api.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="polling,webhook")
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50)
+    parser.add_argument("--names", type=int, default=50)
+    parser.add_argument("--concurrent-updates", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--upstream-latency", type=float, default=0.1)
+    parser.add_argument("--webhook-port", type=int, default=8481)
+    asyncio.run(main(parser.parse_args()))
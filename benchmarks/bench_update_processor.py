@@ -0,0 +1,119 @@
+"""Latency and ordering of concurrent update processing.
+
+Feeds the same stream of updates through python-telegram-bot's sequential
+processing, its unordered concurrent processing and PerUserUpdateProcessor.
+--users users send commands that take --work seconds, while one user sends
+a burst of --flood commands that take --slow-work seconds each. Reports
+p50/p99 latency of the ordinary users' commands and how many commands
+started before the same user's previous command had finished.
+
+Usage: python benchmarks/bench_update_processor.py [--users N] [--flood N]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+FLOODER = 1
+
+
+def make_update(update_id, user_id):
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "text": "/help",
+            },
+        },
+        None,
+    )
+
+
+def make_stream(args, rng):
+    stream = [(FLOODER, args.slow_work) for _ in range(args.flood)]
+    for user_id in range(2, args.users + 2):
+        stream += [(user_id, args.work)] * args.commands
+    rng.shuffle(stream)
+    return stream
+
+
+async def run(processor, stream, interval):
+    latencies = []
+    busy_users = set()
+    overlapping = 0
+
+    async def handle(user_id, work, offered):
+        nonlocal overlapping
+        if user_id in busy_users:
+            overlapping += 1
+        busy_users.add(user_id)
+        await asyncio.sleep(work * random.uniform(0.5, 1.5))
+        busy_users.discard(user_id)
+        if user_id != FLOODER:
+            latencies.append(time.perf_counter() - offered)
+
+    started = time.perf_counter()
+    tasks = []
+    for sequence, (user_id, work) in enumerate(stream):
+        coroutine = handle(user_id, work, time.perf_counter())
+        tasks.append(
+            asyncio.create_task(
+                processor.process_update(make_update(sequence, user_id), coroutine)
+            )
+        )
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return (
+        f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms, "
+        f"{overlapping} overlapping, {time.perf_counter() - started:.1f}s total"
+    )
+
+
+async def main(args):
+    stream = make_stream(args, random.Random(args.seed))
+    interval = 1 / args.rate
+    processors = {
+        "sequential (default)": SimpleUpdateProcessor(1),
+        f"unordered, {args.concurrency} at once": SimpleUpdateProcessor(
+            args.concurrency
+        ),
+        f"per-user ordered, {args.concurrency} at once": PerUserUpdateProcessor(
+            args.concurrency
+        ),
+    }
+    print(
+        f"{len(stream)} updates from {args.users + 1} users at {args.rate:g}/s, "
+        f"one user sending {args.flood} slow commands"
+    )
+    for name, processor in processors.items():
+        random.seed(args.seed)
+        print(f"{name}: {await run(processor, stream, interval)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--commands", type=int, default=5)
+    parser.add_argument("--flood", type=int, default=30)
+    parser.add_argument("--work", type=float, default=0.05)
+    parser.add_argument("--slow-work", type=float, default=1.0)
+    parser.add_argument("--rate", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,208 @@
+"""Memory and operation cost of the watcher registry against the old layout.
+
+The old layout is what cash_functions used before: a dict of user id to a
+list of plain dicts, plus an update time index of dicts, searched with
+linear scans. Both hold the same --watchers watchers (--per-user accounts
+per Telegram user). Memory is measured with tracemalloc; operations are
+averaged over --operations random picks.
+
+Usage: python benchmarks/bench_watcher_registry.py [--watchers N] [--per-user K]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watcher_registry import WatcherRegistry  # noqa: E402
+
+
+def make_data(count, per_user, rng):
+    data = {}
+    for index in range(count):
+        data.setdefault(str(index // per_user), []).append(
+            {
+                "id": f"{index:032x}",
+                "username": f"Player{index}",
+                "last_cash": rng.randrange(1_000_000),
+                "update_time": f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+            }
+        )
+    return data
+
+
+class LegacyWatchers:
+    """The previous structure and its scans, kept here for comparison."""
+
+    def __init__(self, data):
+        self.cash_watchers = {
+            user_id: [dict(entry) for entry in entries]
+            for user_id, entries in data.items()
+        }
+        self.update_time_index = {}
+        for user_id, entries in self.cash_watchers.items():
+            for entry in entries:
+                self.index(user_id, entry)
+
+    def index(self, user_id, entry):
+        slot = self.update_time_index.setdefault(entry["update_time"], {})
+        slot[(user_id, entry["id"])] = entry
+
+    def unindex(self, user_id, entry):
+        slot = self.update_time_index.get(entry["update_time"])
+        if slot is not None:
+            slot.pop((user_id, entry["id"]), None)
+            if not slot:
+                del self.update_time_index[entry["update_time"]]
+
+    def get(self, user_id, session_id):
+        return next(
+            (e for e in self.cash_watchers.get(user_id, []) if e["id"] == session_id),
+            None,
+        )
+
+    def find_by_username(self, user_id, username):
+        for entry in self.cash_watchers.get(user_id, []):
+            if entry["username"].lower() == username.lower():
+                return entry
+        return None
+
+    def set_update_time(self, user_id, entry, update_time):
+        self.unindex(user_id, entry)
+        entry["update_time"] = update_time
+        self.index(user_id, entry)
+
+    def remove(self, user_id, entry):
+        self.cash_watchers[user_id].remove(entry)
+        self.unindex(user_id, entry)
+
+    def add(self, user_id, entry):
+        self.cash_watchers.setdefault(user_id, []).append(entry)
+        self.index(user_id, entry)
+
+    def at_time(self, update_time):
+        slot = self.update_time_index.get(update_time, {})
+        return [(user_id, entry) for (user_id, _), entry in slot.items()]
+
+
+def build_registry(data):
+    registry = WatcherRegistry()
+    registry.load(data)
+    return registry
+
+
+def measure_memory(build, data):
+    gc.collect()
+    tracemalloc.start()
+    structure = build(data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size
+
+
+def per_operation(function, picks):
+    started = time.perf_counter()
+    for pick in picks:
+        function(*pick)
+    return (time.perf_counter() - started) / len(picks) * 1e6
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    data = make_data(args.watchers, args.per_user, rng)
+    legacy, legacy_bytes = measure_memory(LegacyWatchers, data)
+    registry, registry_bytes = measure_memory(build_registry, data)
+    print(
+        f"{args.watchers} watchers, {args.per_user} per user: "
+        f"{legacy_bytes / args.watchers:.0f} B/watcher before, "
+        f"{registry_bytes / args.watchers:.0f} B/watcher with the registry"
+    )
+
+    entries = [
+        (user_id, entry)
+        for user_id, user_entries in data.items()
+        for entry in user_entries
+    ]
+    picks = [rng.choice(entries) for _ in range(args.operations)]
+    times = [f"{rng.randrange(24):02d}:{rng.randrange(60):02d}" for _ in picks]
+
+    rows = [
+        (
+            "lookup by user and session id",
+            per_operation(legacy.get, [(u, e["id"]) for u, e in picks]),
+            per_operation(registry.get, [(u, e["id"]) for u, e in picks]),
+        ),
+        (
+            "lookup by username",
+            per_operation(
+                legacy.find_by_username, [(u, e["username"]) for u, e in picks]
+            ),
+            per_operation(
+                registry.find_by_username, [(u, e["username"]) for u, e in picks]
+            ),
+        ),
+        (
+            "list an update time slot",
+            per_operation(legacy.at_time, [(t,) for t in times]),
+            per_operation(registry.at_time, [(t,) for t in times]),
+        ),
+        (
+            "change update time",
+            per_operation(
+                lambda u, e, t: legacy.set_update_time(u, legacy.get(u, e["id"]), t),
+                [(u, e, t) for (u, e), t in zip(picks, times)],
+            ),
+            per_operation(
+                lambda u, e, t: registry.set_update_time(registry.get(u, e["id"]), t),
+                [(u, e, t) for (u, e), t in zip(picks, times)],
+            ),
+        ),
+    ]
+
+    def legacy_cycle(user_id, entry):
+        existing = legacy.get(user_id, entry["id"])
+        legacy.remove(user_id, existing)
+        legacy.add(user_id, existing)
+
+    def registry_cycle(user_id, entry):
+        registry.add(registry.remove(user_id, entry["id"]))
+
+    unique_picks = list({(u, e["id"]): (u, e) for u, e in picks}.values())
+    rows.append(
+        (
+            "remove and re-add",
+            per_operation(legacy_cycle, unique_picks),
+            per_operation(registry_cycle, unique_picks),
+        )
+    )
+
+    print(f"{'operation':<32} {'before':>10} {'registry':>10}")
+    for name, before, after in rows:
+        print(f"{name:<32} {before:>7.2f} us {after:>7.2f} us")
+
+    # One user watching many accounts is where the scans hurt
+    heavy = {"heavy": make_data(args.heavy, args.heavy, rng)["0"]}
+    legacy = LegacyWatchers(heavy)
+    registry = build_registry(heavy)
+    last = heavy["heavy"][-1]
+    print(
+        f"user with {args.heavy} accounts, lookup of the last one: "
+        f"{per_operation(legacy.get, [('heavy', last['id'])] * 1000):.2f} us before, "
+        f"{per_operation(registry.get, [('heavy', last['id'])] * 1000):.2f} us "
+        "with the registry"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--watchers", type=int, default=100_000)
+    parser.add_argument("--per-user", type=int, default=3)
+    parser.add_argument("--operations", type=int, default=20_000)
+    parser.add_argument("--heavy", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
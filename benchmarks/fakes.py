@@ -0,0 +1,117 @@
+"""Minimal stand-ins for the python-telegram-bot objects handlers receive."""
+
+import asyncio
+import itertools
+import time
+
+_message_ids = itertools.count(1)
+
+
+class FakePhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class FakeMessage:
+    def __init__(self, bot, chat_id, text=""):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.photo = []
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(chat_id=self.chat_id, text=text, **kwargs)
+
+    async def reply_html(self, text, **kwargs):
+        return await self.reply_text(text, **kwargs)
+
+    async def reply_photo(self, photo, caption=None, **kwargs):
+        return await self.bot.send_photo(
+            chat_id=self.chat_id, photo=photo, caption=caption, **kwargs
+        )
+
+    async def reply_media_group(self, media, **kwargs):
+        return await self.bot.send_media_group(chat_id=self.chat_id, media=media)
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        self.bot.record("edit_text", self.chat_id, text)
+        return self
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+    def mention_html(self):
+        return f'<a href="tg://user?id={self.id}">{self.id}</a>'
+
+
+class FakeBot:
+    """Records every call and optionally simulates Telegram API latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+        self.uploads = 0
+
+    def record(self, method, chat_id, payload):
+        self.sent.append((time.perf_counter(), method, chat_id, payload))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.record("send_message", chat_id, text)
+        return FakeMessage(self, chat_id, text)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(photo, bytes):
+            self.uploads += 1
+        self.record("send_photo", chat_id, caption)
+        message = FakeMessage(self, chat_id, caption or "")
+        message.photo = [FakePhotoSize(f"file-{message.message_id}")]
+        return message
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        # Bytes are wrapped in an InputFile; a str is an already uploaded file_id
+        self.uploads += sum(not isinstance(item.media, str) for item in media)
+        self.record("send_media_group", chat_id, [item.caption for item in media])
+        messages = []
+        for item in media:
+            message = FakeMessage(self, chat_id, item.caption or "")
+            message.photo = [FakePhotoSize(f"file-{message.message_id}")]
+            messages.append(message)
+        return messages
+
+
+class FakeUpdate:
+    def __init__(self, bot, user_id, text=""):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(bot, user_id, text)
+
+
+class FakeContext:
+    def __init__(self, bot, args=None, job=None, application=None):
+        self.bot = bot
+        self.args = args or []
+        self.job = job
+        self.application = application
+
+
+class FakeApplication:
+    """Just enough of Application for code that spawns background tasks."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.tasks = set()
+
+    def create_task(self, coroutine, update=None, name=None):
+        task = asyncio.create_task(coroutine, name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
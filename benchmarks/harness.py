@@ -0,0 +1,261 @@
+"""Load-test harness for the bot's main paths, with machine-readable results.
+
+Drives the real code against the local stub site and a fake Telegram bot:
+
+* cash_job: one send_grouped_cash_update run for --watchers accounts
+* update_cash: --users users, each with --accounts-per-user accounts,
+  running /updateCash with --concurrency commands in flight
+* get_stats: --requests /getStats commands over --names distinct characters
+* server_status: an outage alert from check_server_status to --watchers users
+
+Each scenario runs in its own process so peak RSS is per scenario. Results
+are printed (or written to --output) as JSON: operations, throughput,
+p50/p99/max latency in milliseconds, upstream requests and peak RSS.
+
+Usage: python benchmarks/harness.py [--scenarios cash_job,get_stats]
+       [--watchers N] [--latency S] [--error-rate P] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ("cash_job", "update_cash", "get_stats", "server_status")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(name, latencies, elapsed, **extra):
+    result = {
+        "scenario": name,
+        "operations": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if latencies:
+        result.update(
+            p50_ms=round(percentile(latencies, 0.5) * 1000, 2),
+            p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+            max_ms=round(max(latencies) * 1000, 2),
+            mean_ms=round(statistics.mean(latencies) * 1000, 2),
+        )
+    result.update(extra)
+    return result
+
+
+async def bounded(coroutines, concurrency):
+    """Run coroutines with at most ``concurrency`` in flight; return latencies."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def run(coroutine):
+        async with semaphore:
+            started = time.perf_counter()
+            await coroutine
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+    return latencies
+
+
+def make_watchers(users, accounts_per_user, update_time="00:00"):
+    return {
+        str(user): [
+            {
+                "id": f"{user}-{account}",
+                "username": f"user{user}",
+                "last_cash": 0,
+                "update_time": update_time,
+            }
+            for account in range(accounts_per_user)
+        ]
+        for user in range(1, users + 1)
+    }
+
+
+async def cash_job(args, server, bot):
+    import cash_functions
+
+    cash_functions.watchers.load(make_watchers(args.watchers, 1))
+    context = SimpleNamespace(bot=bot, job=SimpleNamespace(data="00:00"))
+    started = time.perf_counter()
+    await cash_functions.send_grouped_cash_update(context)
+    elapsed = time.perf_counter() - started
+    # Latency of each delivered message, measured from the job start
+    latencies = [sent_at - started for sent_at, *_ in bot.sent]
+    return summarize("cash_job", latencies, elapsed)
+
+
+async def update_cash(args, server, bot):
+    import cash_functions
+    from benchmarks.fakes import FakeContext, FakeUpdate
+
+    cash_functions.watchers.load(make_watchers(args.users, args.accounts_per_user))
+    started = time.perf_counter()
+    latencies = await bounded(
+        (
+            cash_functions.update_cash(FakeUpdate(bot, user), FakeContext(bot))
+            for user in range(1, args.users + 1)
+        ),
+        args.concurrency,
+    )
+    return summarize("update_cash", latencies, time.perf_counter() - started)
+
+
+async def get_stats(args, server, bot):
+    import stats_functions
+    from benchmarks.fakes import FakeContext, FakeUpdate
+
+    stats_functions.character_cache.clear()
+    started = time.perf_counter()
+    latencies = await bounded(
+        (
+            stats_functions.get_stats(
+                FakeUpdate(bot, index),
+                FakeContext(bot, args=[f"char{index % args.names}"]),
+            )
+            for index in range(args.requests)
+        ),
+        args.concurrency,
+    )
+    return summarize(
+        "get_stats",
+        latencies,
+        time.perf_counter() - started,
+        cache=stats_functions.character_cache.stats(),
+    )
+
+
+async def server_status(args, server, bot):
+    import telegramBot
+    from benchmarks.fakes import FakeApplication
+    from broadcast import Broadcaster
+    from server_history import OnlineHistory
+    from server_monitor import STATUS_CONFIRM_SAMPLES
+
+    application = FakeApplication(bot)
+    telegramBot.watching_users = set(range(1, args.watchers + 1))
+    telegramBot.is_server_offline = False
+    telegramBot.broadcaster = Broadcaster(bot, rate=args.broadcast_rate, chat_rate=0)
+    telegramBot.online_history = OnlineHistory(100)
+    for _ in range(STATUS_CONFIRM_SAMPLES):
+        telegramBot.online_history.append(0)
+    started = time.perf_counter()
+    await telegramBot.check_server_status(application, 0)
+    await asyncio.gather(*application.tasks)
+    elapsed = time.perf_counter() - started
+    latencies = [sent_at - started for sent_at, *_ in bot.sent]
+    return summarize("server_status", latencies, elapsed)
+
+
+async def run_scenario(name, args):
+    import cash_functions
+    import http_client
+    import server_monitor
+    import stats_functions
+    import storage
+    from benchmarks.fakes import FakeBot
+    from benchmarks.stub_server import StubServer
+    from fetch_scheduler import fetch_scheduler
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        storage._storage = storage.SQLiteStorage(
+            os.path.join(directory, "bench.db"),
+            os.path.join(directory, "none.json"),
+            os.path.join(directory, "none.json"),
+        )
+        stub = StubServer(latency=args.latency, error_rate=args.error_rate)
+        async with stub as server:
+            for module in (cash_functions, stats_functions, server_monitor):
+                module.BASE_URL = server.url
+            fetch_scheduler.max_concurrency = args.concurrency
+            fetch_scheduler.rate_per_host = args.rate_per_host
+            await http_client.start_http_session()
+            bot = FakeBot(latency=args.telegram_latency)
+            result = await globals()[name](args, server, bot)
+            result["upstream_requests"] = server.requests
+            result["telegram_calls"] = len(bot.sent)
+            await http_client.close_http_session()
+        storage.close_storage()
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_in_subprocess(name, argv):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argv, "--scenario-process", name],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=list(SCENARIOS),
+    )
+    parser.add_argument("--watchers", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--accounts-per-user", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--names", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate-per-host", type=float, default=0)
+    parser.add_argument("--broadcast-rate", type=float, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.005)
+    parser.add_argument("--output")
+    parser.add_argument("--scenario-process", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario_process:
+        print(json.dumps(asyncio.run(run_scenario(args.scenario_process, args))))
+        return
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    argv = [arg for arg in sys.argv[1:] if arg != "--output" and arg != args.output]
+    report = {
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "scenario_process")
+        },
+        "results": [run_in_subprocess(name, argv) for name in args.scenarios],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
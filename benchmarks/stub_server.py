@@ -0,0 +1,96 @@
+"""Local stand-in for maplelegends.com used by the benchmarks.
+
+Serves saved page fixtures with configurable latency and error rate so the
+bot's network paths can be measured without touching the real site.
+"""
+
+import asyncio
+import json
+import os
+import random
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name, mode="r"):
+    with open(os.path.join(FIXTURES_DIR, name), mode) as f:
+        return f.read()
+
+
+class StubServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._connections = set()
+        self.account_page = load_fixture("account.html")
+        self.character = json.loads(load_fixture("character.json"))
+        self.avatar = load_fixture("avatar.png", "rb")
+        self.online_users = 1500
+        self._runner = None
+
+    @property
+    def connections(self):
+        """Number of distinct TCP connections that carried a request."""
+        return len(self._connections)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _delay_or_fail(self, request):
+        self.requests += 1
+        self._connections.add(id(request.transport))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise web.HTTPServiceUnavailable()
+
+    async def account(self, request):
+        await self._delay_or_fail(request)
+        return web.Response(text=self.account_page, content_type="text/html")
+
+    async def character_api(self, request):
+        await self._delay_or_fail(request)
+        data = dict(self.character, name=request.query.get("name", ""))
+        return web.json_response(data)
+
+    async def avatar_api(self, request):
+        await self._delay_or_fail(request)
+        return web.Response(body=self.avatar, content_type="image/png")
+
+    async def online_users_api(self, request):
+        await self._delay_or_fail(request)
+        return web.json_response({"usercount": self.online_users})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/my/account", self.account)
+        app.router.add_get("/api/character", self.character_api)
+        app.router.add_get("/api/getavatar", self.avatar_api)
+        app.router.add_get("/api/get_online_users", self.online_users_api)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the real port when an ephemeral one was requested
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from fetch_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+
+
+def retry_after_seconds(error):
+    retry_after = error.retry_after
+    # Newer python-telegram-bot releases report a timedelta
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def is_unreachable(error):
+    """True if the chat will never accept messages from the bot again."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in error.message.lower()
+
+
+class BroadcastResult:
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.blocked = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.sent}/{self.total} sent, {len(self.blocked)} blocked, "
+            f"{self.failed} failed, {self.retries} retries in {self.elapsed:.1f}s"
+        )
+
+
+class Broadcaster:
+    """Send one message to many chats within Telegram's flood limits.
+
+    A fixed pool of workers sends under a global token bucket and a minimum
+    spacing per chat. A RetryAfter pauses every worker for the requested time
+    before the message is retried, network errors are retried with jittered
+    backoff, and chats that blocked the bot are reported back in
+    ``BroadcastResult.blocked`` instead of aborting the fan-out. Broadcasts
+    run one at a time so each chat receives them in order.
+    """
+
+    def __init__(
+        self,
+        bot,
+        concurrency=BROADCAST_CONCURRENCY,
+        rate=BROADCAST_RATE,
+        chat_rate=BROADCAST_CHAT_RATE,
+        max_retries=BROADCAST_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.concurrency = concurrency
+        # No burst: sends are spaced evenly at the global rate
+        self.bucket = TokenBucket(rate, 1)
+        self.chat_interval = 1 / chat_rate if chat_rate > 0 else 0
+        self.max_retries = max_retries
+        self._next_chat_send = {}
+        self._paused_until = 0.0
+        self._lock = None
+
+    async def _wait_turn(self, chat_id):
+        while True:
+            now = time.monotonic()
+            delay = max(
+                self._paused_until - now, self._next_chat_send.get(chat_id, 0) - now
+            )
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+        # A flood wait may have started while this worker waited for a token
+        while self._paused_until > time.monotonic():
+            await asyncio.sleep(self._paused_until - time.monotonic())
+        self._next_chat_send[chat_id] = time.monotonic() + self.chat_interval
+
+    async def send(self, chat_id, text, result, **kwargs):
+        attempt = 0
+        while True:
+            await self._wait_turn(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                result.sent += 1
+                return
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(
+                    f"Flood control hit while broadcasting, pausing for {delay}s"
+                )
+            except Exception as e:
+                if is_unreachable(e):
+                    result.blocked.append(chat_id)
+                    return
+                # BadRequest subclasses NetworkError but won't succeed on retry
+                if (
+                    not isinstance(e, NetworkError)
+                    or isinstance(e, BadRequest)
+                    or attempt >= self.max_retries
+                ):
+                    logger.error(f"Error sending broadcast to {chat_id}: {str(e)}")
+                    result.failed += 1
+                    return
+                await asyncio.sleep(random.uniform(0, 2**attempt))
+            attempt += 1
+            result.retries += 1
+
+    async def broadcast(self, chat_ids, text, **kwargs):
+        """Send ``text`` to every chat in ``chat_ids`` and return a BroadcastResult."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            chat_ids = list(chat_ids)
+            result = BroadcastResult(len(chat_ids))
+            started = time.monotonic()
+            self._prune()
+            pending = iter(chat_ids)
+
+            async def worker():
+                for chat_id in pending:
+                    await self.send(chat_id, text, result, **kwargs)
+
+            await asyncio.gather(
+                *(worker() for _ in range(min(self.concurrency, len(chat_ids))))
+            )
+            result.elapsed = time.monotonic() - started
+            return result
+
+    def _prune(self):
+        now = time.monotonic()
+        self._next_chat_send = {
+            chat_id: at for chat_id, at in self._next_chat_send.items() if at > now
+        }
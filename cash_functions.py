@@ -1,25 +1,63 @@
 import asyncio
-import json
 import os
 from asyncio.log import logger
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 
-import aiohttp
-from bs4 import BeautifulSoup
 from telegram import Update
 from telegram.ext import ContextTypes
 
-CASH_WATCHERS_FILE = "cash_watchers.json"
-cash_watchers = {}
-
-
-def load_cash_watchers():
-    global cash_watchers
-    if os.path.exists(CASH_WATCHERS_FILE):
-        with open(CASH_WATCHERS_FILE, "r") as f:
-            cash_watchers = json.load(f)
-    else:
-        cash_watchers = {}
+import cash_workers
+from cash_history import record_cash_results
+from cash_parser import parse_account_page_async
+from fetch_scheduler import fetch_scheduler
+from http_client import BASE_URL, get_session
+from profiling import profiled, span
+from storage import get_storage
+from ttl_cache import TTLCache
+from update_processor import create_background_task
+from watcher_registry import CashWatcher, WatcherRegistry
+
+# Minutes before each update time over which fetches are spread (0 disables)
+CASH_SMOOTHING_WINDOW = int(os.getenv("CASH_SMOOTHING_WINDOW", "0"))
+CASH_SMOOTHING_BATCH_SIZE = int(os.getenv("CASH_SMOOTHING_BATCH_SIZE", "50"))
+# Seconds an account page result is reused for the same session id (0 only
+# merges requests that are in flight at the same time)
+CASH_CACHE_TTL = float(os.getenv("CASH_CACHE_TTL", "60"))
+CASH_CACHE_MAX_ENTRIES = int(os.getenv("CASH_CACHE_MAX_ENTRIES", "10000"))
+# Watchers read from storage between two chances for the event loop to handle
+# updates while the state loads at startup
+CASH_LOAD_BATCH_SIZE = int(os.getenv("CASH_LOAD_BATCH_SIZE", "2000"))
+# Every watched account, indexed by user and session id, username and slot
+watchers = WatcherRegistry()
+# update_time -> the single cash_update job for that slot
+cash_update_jobs = {}
+# session id -> (username, cash amount)
+cash_cache = TTLCache(max_entries=CASH_CACHE_MAX_ENTRIES, ttl=CASH_CACHE_TTL)
+# Fetches skipped because another watcher in the same job had the same id
+job_deduplicated = 0
+
+
+async def load_cash_watchers(batch_size=CASH_LOAD_BATCH_SIZE):
+    """Fill the registry from storage a batch at a time. Returns the count."""
+    watchers.clear()
+    for batch in get_storage().iter_cash_watchers(batch_size):
+        for user_id, entry in batch:
+            watchers.add(CashWatcher.from_dict(user_id, entry))
+        # Let updates that don't need the watchers through in between
+        await asyncio.sleep(0)
+    return len(watchers)
+
+
+def save_cash_results(updated):
+    """Persist fetched results, skipping watchers removed in the meantime."""
+    rows = [
+        (watcher.user_id, watcher.to_dict())
+        for watcher in updated
+        if watcher in watchers
+    ]
+    get_storage().save_cash_results(rows)
+    record_cash_results(rows)
 
 
 async def remove_cash_watcher(
@@ -34,80 +72,151 @@ async def remove_cash_watcher(
 
     username_to_remove = args[0]
 
-    if user_id not in cash_watchers or not cash_watchers[user_id]:
+    if not watchers.for_user(user_id):
         await update.message.reply_text("You don't have any registered cash watchers.")
         return
 
-    for entry in cash_watchers[user_id]:
-        if entry["username"].lower() == username_to_remove.lower():
-            cash_watchers[user_id].remove(entry)
-            save_cash_watchers()
-            schedule_cash_updates(context)
-            await update.message.reply_text(
-                f"Successfully removed cash watcher for {entry['username']}."
-            )
-            return
+    watcher = watchers.find_by_username(user_id, username_to_remove)
+    if watcher is None:
+        await update.message.reply_text(
+            f"No cash watcher found for username: {username_to_remove}"
+        )
+        return
 
+    watchers.remove(user_id, watcher.id)
+    get_storage().delete_cash_watcher(user_id, watcher.id)
+    get_storage().delete_cash_history(user_id, watcher.id)
+    update_cash_slots(context, watcher.update_time)
     await update.message.reply_text(
-        f"No cash watcher found for username: {username_to_remove}"
+        f"Successfully removed cash watcher for {watcher.username}."
     )
 
 
 def schedule_cash_updates(context: ContextTypes.DEFAULT_TYPE):
+    """Rebuild every cash_update job from the watchers. Used at startup."""
     # Remove all existing cash update jobs
     for job in context.job_queue.get_jobs_by_name("cash_update"):
         job.schedule_removal()
+    cash_update_jobs.clear()
 
-    # Create a dictionary to group accounts by update time
-    update_times = {}
-
-    # Group accounts by update time
-    for user_id, accounts in cash_watchers.items():
-        for account in accounts:
-            update_time = account["update_time"]
-            if update_time not in update_times:
-                update_times[update_time] = []
-            update_times[update_time].append((user_id, account))
-
-    # Schedule new jobs for each update time
-    for update_time, accounts in update_times.items():
-        time = datetime.strptime(update_time, "%H:%M").time()
-        context.job_queue.run_daily(
-            send_grouped_cash_update,
-            time=time,
-            name="cash_update",
-            data=accounts,
-        )
+    for update_time in watchers.update_times():
+        add_cash_update_job(context.job_queue, update_time)
+
+
+def add_cash_update_job(job_queue, update_time):
+    """Schedule the daily job for one update time slot.
+
+    With smoothing enabled the job starts CASH_SMOOTHING_WINDOW minutes early
+    and delivers on time.
+    """
+    start = datetime.strptime(update_time, "%H:%M")
+    time = (start - timedelta(minutes=CASH_SMOOTHING_WINDOW)).time()
+    cash_update_jobs[update_time] = job_queue.run_daily(
+        profiled("cash_update", send_grouped_cash_update),
+        time=time,
+        name="cash_update",
+        data=update_time,
+    )
+
+
+def update_cash_slots(context: ContextTypes.DEFAULT_TYPE, *update_times):
+    """Add or remove the jobs of the given slots after a watcher changed.
+
+    Only the affected slots are touched: a slot gets a job when its first
+    account arrives and loses it when its last account leaves.
+    """
+    for update_time in set(update_times):
+        job = cash_update_jobs.get(update_time)
+        if watchers.has_update_time(update_time) and job is None:
+            add_cash_update_job(context.job_queue, update_time)
+        elif not watchers.has_update_time(update_time) and job is not None:
+            job.schedule_removal()
+            del cash_update_jobs[update_time]
+
+
+def plan_cash_batches(
+    accounts, window=CASH_SMOOTHING_WINDOW * 60, batch_size=CASH_SMOOTHING_BATCH_SIZE
+):
+    """Split watchers into sub-batches spread over ``window`` seconds.
+
+    Returns a list of (start offset in seconds, batch). All accounts of a user
+    stay in the same batch so they still arrive as one message.
+    """
+    if not window or not accounts:
+        return [(0, accounts)]
+
+    by_user = {}
+    for watcher in accounts:
+        by_user.setdefault(watcher.user_id, []).append(watcher)
+
+    batches = []
+    current = []
+    for user_accounts in by_user.values():
+        if current and len(current) + len(user_accounts) > batch_size:
+            batches.append(current)
+            current = []
+        current.extend(user_accounts)
+    batches.append(current)
+
+    spacing = window / len(batches)
+    return [(index * spacing, batch) for index, batch in enumerate(batches)]
 
 
 async def send_grouped_cash_update(context: ContextTypes.DEFAULT_TYPE) -> None:
     job = context.job
-    accounts = job.data
-
-    async def fetch_cash(user_id, account):
-        maplelegends_id = account["id"]
-        stored_username = account["username"]
-        last_cash = account.get("last_cash", 0)
+    accounts = watchers.at_time(job.data)
+    loop = asyncio.get_running_loop()
+    deliver_at = loop.time() + CASH_SMOOTHING_WINDOW * 60
+    updated = []
+    # One fetch per session id for the whole job, even across sub-batches
+    fetches = {}
+    requested = set()
+
+    def fetch_once(maplelegends_id):
+        global job_deduplicated
+        if maplelegends_id in requested:
+            job_deduplicated += 1
+        requested.add(maplelegends_id)
+        fetch = fetches.get(maplelegends_id)
+        if fetch is None:
+            fetch = fetches[maplelegends_id] = asyncio.ensure_future(
+                get_cash_amount(maplelegends_id)
+            )
+        return fetch
 
+    async def fetch_cash(watcher):
+        maplelegends_id = watcher.id
         try:
-            async with aiohttp.ClientSession() as session:
-                username, cash_amount = await get_cash_amount(maplelegends_id, session)
-            difference = cash_amount - last_cash
+            username, cash_amount = await fetch_once(maplelegends_id)
+            difference = cash_amount - watcher.last_cash
             message = f"{username}: {cash_amount:,} ({difference:+,} since last check)"
 
             # Update the stored cash amount
-            account["last_cash"] = cash_amount
-            account["username"] = username
+            watchers.set_result(watcher, username, cash_amount)
+            updated.append(watcher)
         except Exception as e:
             logger.error(f"Error getting cash for user {maplelegends_id}: {str(e)}")
-            message = f"{stored_username} (ID {maplelegends_id}): Error fetching data"
+            message = f"{watcher.username} (ID {maplelegends_id}): Error fetching data"
+
+        return watcher.user_id, message
 
-        return user_id, message
+    async def fetch_batch(offset, batch):
+        await asyncio.sleep(offset)
+        if cash_workers.pool is not None:
+            # Hand the batch's new session ids to the worker processes
+            new_ids = {watcher.id for watcher in batch} - fetches.keys()
+            fetches.update(cash_workers.pool.submit(list(new_ids)))
+        return await asyncio.gather(*[fetch_cash(watcher) for watcher in batch])
 
-    # Fetch cash for all accounts concurrently
-    results = await asyncio.gather(
-        *[fetch_cash(user_id, account) for user_id, account in accounts]
+    # Fetch cash for each sub-batch at its offset within the smoothing window
+    batch_results = await asyncio.gather(
+        *[fetch_batch(offset, batch) for offset, batch in plan_cash_batches(accounts)]
     )
+    results = [result for batch in batch_results for result in batch]
+
+    # Hold the messages until the requested update time
+    with span("wait"):
+        await asyncio.sleep(max(0, deliver_at - loop.time()))
 
     # Group results by user_id
     grouped_results = {}
@@ -120,16 +229,18 @@ async def send_grouped_cash_update(context: ContextTypes.DEFAULT_TYPE) -> None:
     for user_id, messages in grouped_results.items():
         full_message = "Vote Cash update:\n" + "\n".join(messages)
         try:
-            await context.bot.send_message(chat_id=user_id, text=full_message)
+            with span("send"):
+                await context.bot.send_message(chat_id=user_id, text=full_message)
         except Exception as e:
             logger.error(f"Error sending cash update to user {user_id}: {str(e)}")
 
-    save_cash_watchers()
-
-
-def save_cash_watchers():
-    with open(CASH_WATCHERS_FILE, "w") as f:
-        json.dump(cash_watchers, f)
+    with span("persist"):
+        save_cash_results(updated)
+    logger.info(
+        f"Cash update for {len(accounts)} accounts ({len(fetches)} session ids) "
+        f"done, fetch scheduler: {fetch_scheduler.stats()}, "
+        f"cash cache: {cash_cache_stats()}, workers: {cash_workers.stats()}"
+    )
 
 
 async def watch_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -145,107 +256,127 @@ async def watch_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     update_time = args[0]
     maplelegends_id = args[1]
 
-    # Validate time format
+    # Validate time format and normalise it so e.g. 9:05 and 09:05 share a slot
     try:
-        datetime.strptime(update_time, "%H:%M")
+        update_time = datetime.strptime(update_time, "%H:%M").strftime("%H:%M")
     except ValueError:
         await update.message.reply_text("Invalid time format. Please use HH:MM.")
         return
 
     try:
-        async with aiohttp.ClientSession() as session:
-            username, cash_amount = await get_cash_amount(maplelegends_id, session)
+        username, cash_amount = await get_cash_amount(maplelegends_id)
     except Exception as e:
         await update.message.reply_text(f"Error fetching data: {str(e)}")
         return
 
-    if user_id not in cash_watchers:
-        cash_watchers[user_id] = []
+    existing = watchers.get(user_id, maplelegends_id)
 
-    existing_entry = next(
-        (item for item in cash_watchers[user_id] if item["id"] == maplelegends_id), None
-    )
-
-    if existing_entry:
-        existing_entry["update_time"] = update_time
+    if existing:
+        watcher = existing
+        previous_time = watcher.update_time
+        watchers.set_update_time(watcher, update_time)
         await update.message.reply_text(
             f"Updated: You will receive daily cash updates for {username} at {update_time} UTC"
         )
     else:
-        cash_watchers[user_id].append(
-            {
-                "id": maplelegends_id,
-                "username": username,
-                "last_cash": cash_amount,
-                "update_time": update_time,
-            }
+        previous_time = update_time
+        watcher = CashWatcher(
+            user_id, maplelegends_id, username, cash_amount, update_time
         )
+        watchers.add(watcher)
         await update.message.reply_text(
             f"You will now receive daily cash updates for {username} at {update_time} UTC"
         )
 
-    save_cash_watchers()
-    schedule_cash_updates(context)
+    get_storage().save_cash_watcher(user_id, watcher.to_dict())
+    if not existing:
+        record_cash_results([(user_id, watcher.to_dict())])
+    update_cash_slots(context, previous_time, update_time)
 
 
 async def send_cash_update(context: ContextTypes.DEFAULT_TYPE) -> None:
     job = context.job
     user_id = job.chat_id
-    account = job.data
+    watcher = job.data
 
-    maplelegends_id = account["id"]
-    stored_username = account["username"]
-    last_cash = account.get("last_cash", 0)
+    maplelegends_id = watcher.id
+    updated = []
 
     try:
-        async with aiohttp.ClientSession() as session:
-            username, cash_amount = await get_cash_amount(maplelegends_id, session)
-        difference = cash_amount - last_cash
+        username, cash_amount = await get_cash_amount(maplelegends_id)
+        difference = cash_amount - watcher.last_cash
         message = f"Vote Cash update for {username}: {cash_amount:,} ({difference:+,} since last check)"
 
         # Update the stored cash amount
-        account["last_cash"] = cash_amount
-        account["username"] = username
+        watchers.set_result(watcher, username, cash_amount)
+        updated.append(watcher)
     except Exception as e:
         logger.error(f"Error getting cash for user {maplelegends_id}: {str(e)}")
-        message = f"Error fetching data for {stored_username} (ID {maplelegends_id})"
+        message = f"Error fetching data for {watcher.username} (ID {maplelegends_id})"
 
     try:
-        await context.bot.send_message(chat_id=user_id, text=message)
+        with span("send"):
+            await context.bot.send_message(chat_id=user_id, text=message)
     except Exception as e:
         logger.error(f"Error sending cash update to user {user_id}: {str(e)}")
 
-    save_cash_watchers()
+    with span("persist"):
+        save_cash_results(updated)
+
+
+def cash_cache_stats():
+    """Cache counters plus the number of upstream requests saved in total."""
+    stats = cash_cache.stats()
+    stats["job_deduplicated"] = job_deduplicated
+    stats["saved"] = stats["hits"] + stats["coalesced"] + job_deduplicated
+    return stats
+
 
+async def get_cash_amount(user_id, session=None):
+    """Helper function to get cash amount and username.
 
-async def get_cash_amount(user_id, session):
-    """Helper function to get cash amount and username."""
-    url = "https://maplelegends.com/my/account"
+    Results are cached per session id for CASH_CACHE_TTL seconds, and
+    concurrent calls for the same id share one request.
+    """
+
+    async def load():
+        return await fetch_cash_amount(user_id, session)
+
+    return await cash_cache.get_or_load(user_id, load)
+
+
+async def fetch_cash_amount(user_id, session=None):
+    """Fetch and parse the account page of one session id.
+
+    Uses the shared pooled session unless one is passed in explicitly.
+    """
+    if session is None:
+        session = get_session()
+    url = f"{BASE_URL}/my/account"
     headers = {
         "accept": "*/*",
         "accept-language": "en-US,en;q=0.9",
         "cookie": f"mlTheme=light; webpy_session_id={user_id}",
-        "referer": "https://maplelegends.com/vote",
+        "referer": f"{BASE_URL}/vote",
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
     }
 
-    async with session.get(url, headers=headers) as response:
-        response.raise_for_status()
-        text = await response.text()
+    async def fetch_page():
+        # Only the request itself; the scheduler times waiting for a slot
+        with span("fetch"):
+            async with session.get(url, headers=headers) as response:
+                response.raise_for_status()
+                return await response.text()
 
-    soup = BeautifulSoup(text, "html.parser")
-    vote_cash_element = soup.select_one('div.col-md-6:-soup-contains("Vote Cash:") b')
-    username_element = soup.select_one(
-        "ul.nav.navbar-nav.pull-right li.visible-md.visible-lg a.spa"
-    )
+    text = await fetch_scheduler.run(urlsplit(url).hostname, fetch_page)
 
-    if vote_cash_element and username_element:
-        cash_amount = vote_cash_element.text.strip().replace(",", "")
-        return username_element.text.strip(), int(float(cash_amount))
-    else:
+    with span("parse"):
+        account = await parse_account_page_async(text)
+    if account is None:
         raise ValueError(
             f"Unable to find Vote Cash or username information for user ID {user_id}"
         )
+    return account
 
 
 async def get_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -259,8 +390,7 @@ async def get_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = context.args[0]
 
     try:
-        async with aiohttp.ClientSession() as session:
-            username, vote_cash = await get_cash_amount(user_id, session)
+        username, vote_cash = await get_cash_amount(user_id)
         await update.message.reply_text(f"Vote Cash amount for {username}: {vote_cash}")
     except ValueError as e:
         await update.message.reply_text(str(e))
@@ -271,7 +401,8 @@ async def get_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def update_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.effective_user.id)
 
-    if user_id not in cash_watchers or not cash_watchers[user_id]:
+    user_watchers = watchers.for_user(user_id)
+    if not user_watchers:
         await update.message.reply_text(
             "You haven't registered any accounts to watch. Use /watchCash to add accounts."
         )
@@ -279,32 +410,23 @@ async def update_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     # Send an initial message
     message = await update.message.reply_text("Fetching cash amounts...")
+    updated = []
 
-    async def fetch_cash(entry):
-        async with aiohttp.ClientSession() as session:
-            maplelegends_id = entry["id"]
-            stored_username = entry["username"]
-            last_cash = entry.get("last_cash", 0)
-            try:
-                async with aiohttp.ClientSession() as session:
-                    username, cash_amount = await get_cash_amount(
-                        maplelegends_id, session
-                    )
-                difference = cash_amount - last_cash
-                result = (
-                    f"{username}: {cash_amount:,} ({difference:+,} since last check)\n"
-                )
-                entry["last_cash"] = cash_amount
-                entry["username"] = username
-                return result
-            except Exception as e:
-                logger.error(f"Error getting cash for user {maplelegends_id}: {str(e)}")
-                return (
-                    f"{stored_username} (ID {maplelegends_id}): Error fetching data\n"
-                )
+    async def fetch_cash(watcher):
+        maplelegends_id = watcher.id
+        try:
+            username, cash_amount = await get_cash_amount(maplelegends_id)
+            difference = cash_amount - watcher.last_cash
+            result = f"{username}: {cash_amount:,} ({difference:+,} since last check)\n"
+            watchers.set_result(watcher, username, cash_amount)
+            updated.append(watcher)
+            return result
+        except Exception as e:
+            logger.error(f"Error getting cash for user {maplelegends_id}: {str(e)}")
+            return f"{watcher.username} (ID {maplelegends_id}): Error fetching data\n"
 
     # Create tasks for all cash fetching operations
-    tasks = [fetch_cash(entry) for entry in cash_watchers[user_id]]
+    tasks = [fetch_cash(watcher) for watcher in user_watchers]
 
     # Run all tasks concurrently
     results = await asyncio.gather(*tasks)
@@ -313,12 +435,21 @@ async def update_cash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     result_message = "Current Vote Cash amounts:\n" + "".join(results)
 
     # Update the message with the results
-    await message.edit_text(result_message)
-    save_cash_watchers()  # Save the updated cash amounts
+    with span("send"):
+        await message.edit_text(result_message)
+    # Save the updated cash amounts
+    with span("persist"):
+        save_cash_results(updated)
 
 
-# Modify your command handler to use create_task
+# Runs in the background so the user's next command isn't held up by the
+# fetches; the task is awaited on shutdown and its errors are reported.
+# Profiled here, around the work, rather than where the handler is registered.
 async def handle_update_cash(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
-    asyncio.create_task(update_cash(update, context))
+    create_background_task(
+        context.application,
+        profiled("updateCash", update_cash)(update, context),
+        update,
+    )
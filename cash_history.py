@@ -0,0 +1,150 @@
+"""Per-account vote cash history and the /cashHistory command.
+
+Every successful cash check is recorded as the account's sample for that
+UTC day (a later check on the same day replaces it). Each sample also stores
+the running sum and count of all samples up to it, so the delta and the
+average balance over any period come from the newest sample and the one at
+the start of the period, whatever the length of the history. Samples older
+than CASH_HISTORY_DAILY_DAYS are thinned to one per week by a daily job;
+the running totals stay valid because they are never recomputed.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from storage import get_storage
+
+CASH_HISTORY_DAILY_DAYS = int(os.getenv("CASH_HISTORY_DAILY_DAYS", "100"))
+CASH_HISTORY_PERIODS = (7, 30, 90)
+
+
+def utc_day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def record_cash_results(results, timestamp=None):
+    """Add today's sample for each ``(user_id, account)`` that was just checked."""
+    if not results:
+        return
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).timestamp()
+    day = utc_day(timestamp)
+    storage = get_storage()
+    latest = storage.latest_cash_samples(
+        [(user_id, account["id"]) for user_id, account in results]
+    )
+    samples = []
+    for user_id, account in results:
+        cash = account["last_cash"]
+        cash_sum, count = 0, 0
+        previous = latest.get((user_id, account["id"]))
+        if previous is not None:
+            cash_sum, count = previous["cash_sum"], previous["samples"]
+            if previous["day"] == day:
+                # Replace today's earlier sample instead of adding another
+                cash_sum, count = cash_sum - previous["cash"], count - 1
+        samples.append(
+            {
+                "user_id": user_id,
+                "account_id": account["id"],
+                "day": day,
+                "timestamp": timestamp,
+                "cash": cash,
+                "cash_sum": cash_sum + cash,
+                "samples": count + 1,
+            }
+        )
+    storage.save_cash_samples(samples)
+
+
+def summarize_cash_history(user_id, account_id, periods=CASH_HISTORY_PERIODS, now=None):
+    """Delta, gain per day and average balance for each period in days.
+
+    Returns ``(latest sample, [(days, since, delta, per day, average)])`` or
+    None without history. ``since`` is None, except for a period longer than
+    the history: that one covers the whole history and ``since`` is its
+    first day.
+    """
+    storage = get_storage()
+    latest = storage.latest_cash_sample(user_id, account_id)
+    if latest is None:
+        return None
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    summaries = []
+    for days in periods:
+        base = storage.cash_sample_at(
+            user_id, account_id, (now - timedelta(days=days)).strftime("%Y-%m-%d")
+        )
+        if base is None:
+            # Not enough history: average over everything since the first sample
+            base = storage.first_cash_sample(user_id, account_id)
+            since = base["day"]
+            cash_sum = latest["cash_sum"]
+            count = latest["samples"]
+        else:
+            since = None
+            cash_sum = latest["cash_sum"] - base["cash_sum"]
+            count = latest["samples"] - base["samples"]
+        elapsed = (
+            datetime.strptime(latest["day"], "%Y-%m-%d")
+            - datetime.strptime(base["day"], "%Y-%m-%d")
+        ).days
+        delta = latest["cash"] - base["cash"]
+        summaries.append(
+            (
+                days,
+                since,
+                delta,
+                delta / elapsed if elapsed else 0,
+                cash_sum / count if count else latest["cash"],
+            )
+        )
+    return latest, summaries
+
+
+def format_cash_history(username, latest, summaries):
+    lines = [f"Vote Cash history for {username}:", f"Now: {latest['cash']:,}"]
+    for days, since, delta, per_day, average in summaries:
+        line = f"{days}d: {delta:+,} ({per_day:+,.0f}/day), avg balance {average:,.0f}"
+        lines.append(line if since is None else f"{line} since {since}")
+    return "\n".join(lines)
+
+
+async def cash_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the cash history of one of the user's own watched accounts."""
+    user_id = str(update.effective_user.id)
+
+    if not context.args:
+        await update.message.reply_text("Usage: /cashHistory <username>")
+        return
+
+    # Imported here: cash_functions imports this module
+    from cash_functions import watchers
+
+    username = context.args[0]
+    watcher = watchers.find_by_username(user_id, username)
+    if watcher is None:
+        await update.message.reply_text(
+            f"No cash watcher found for username: {username}"
+        )
+        return
+
+    summary = summarize_cash_history(user_id, watcher.id)
+    if summary is None:
+        await update.message.reply_text(
+            f"No cash history recorded for {watcher.username} yet."
+        )
+        return
+
+    await update.message.reply_text(format_cash_history(watcher.username, *summary))
+
+
+async def downsample_cash_history(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Daily job thinning samples older than CASH_HISTORY_DAILY_DAYS to weekly."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=CASH_HISTORY_DAILY_DAYS)
+    get_storage().downsample_cash_history(cutoff.strftime("%Y-%m-%d"))
@@ -0,0 +1,309 @@
+"""Extract the username and vote cash from a /my/account page.
+
+The page only needs two strings, so instead of building a full BeautifulSoup
+tree the default backend scans the markup with ``html.parser.HTMLParser`` and
+stops as soon as both values are known. An lxml backend is used when
+``CASH_PARSER=lxml`` and lxml is installed. The BeautifulSoup selectors the
+bot used originally are kept as the ``bs4`` backend and serve as the
+reference the others are checked against.
+
+Parsing is CPU-bound, so ``CASH_PARSE_EXECUTOR`` can move it off the event
+loop: ``process`` uses a process pool and scales across cores with any
+backend, ``thread`` only helps with the lxml backend (which releases the GIL
+while parsing), and ``inline`` parses on the loop.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+
+from metrics import parse_duration
+
+CASH_PARSER = os.getenv("CASH_PARSER", "htmlparser")
+CASH_PARSE_EXECUTOR = os.getenv("CASH_PARSE_EXECUTOR", "inline")
+CASH_PARSE_WORKERS = int(os.getenv("CASH_PARSE_WORKERS", "0")) or os.cpu_count()
+
+PARSE_EXECUTORS = ("inline", "thread", "process")
+if CASH_PARSE_EXECUTOR not in PARSE_EXECUTORS:
+    raise ValueError(
+        f"Unknown CASH_PARSE_EXECUTOR {CASH_PARSE_EXECUTOR!r}, "
+        f"use one of: {', '.join(PARSE_EXECUTORS)}"
+    )
+
+VOTE_CASH_LABEL = "Vote Cash:"
+VOID_ELEMENTS = frozenset(
+    (
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    )
+)
+USERNAME_UL_CLASSES = frozenset(("nav", "navbar-nav", "pull-right"))
+USERNAME_LI_CLASSES = frozenset(("visible-md", "visible-lg"))
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _CashDiv:
+    """An open ``div.col-md-6`` and the text seen inside it so far."""
+
+    __slots__ = ("order", "index", "text", "b_index", "b_text")
+
+    def __init__(self, order, index):
+        self.order = order
+        self.index = index
+        self.text = []
+        self.b_index = None
+        self.b_text = None
+
+
+class AccountPageParser(HTMLParser):
+    """Streaming equivalent of the two selectors used on the account page.
+
+    ``div.col-md-6:-soup-contains("Vote Cash:") b`` and
+    ``ul.nav.navbar-nav.pull-right li.visible-md.visible-lg a.spa``. Open
+    elements are tracked on a stack the same way BeautifulSoup's html.parser
+    builder does (unmatched end tags are ignored, an end tag closes everything
+    opened after its start tag), and parsing stops once both values are found.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.username = None
+        self.cash = None
+        self._stack = []
+        self._divs = []
+        self._matches = []
+        self._div_count = 0
+        self._a_index = None
+        self._a_text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        classes = ()
+        for name, value in attrs:
+            if name == "class" and value:
+                classes = value.split()
+                break
+        index = len(self._stack)
+        self._stack.append((tag, classes))
+
+        if tag == "div" and self.cash is None and "col-md-6" in classes:
+            self._div_count += 1
+            self._divs.append(_CashDiv(self._div_count, index))
+        elif tag == "b":
+            for div in self._divs:
+                if div.b_text is None:
+                    div.b_index = index
+                    div.b_text = []
+        elif (
+            tag == "a"
+            and self.username is None
+            and self._a_index is None
+            and "spa" in classes
+            and self._in_username_list()
+        ):
+            self._a_index = index
+            self._a_text = []
+
+    def _in_username_list(self):
+        found_li = False
+        for tag, classes in reversed(self._stack[:-1]):
+            if not found_li:
+                found_li = tag == "li" and USERNAME_LI_CLASSES.issubset(classes)
+            elif tag == "ul" and USERNAME_UL_CLASSES.issubset(classes):
+                return True
+        return False
+
+    def handle_data(self, data):
+        for div in self._divs:
+            div.text.append(data)
+            if div.b_index is not None:
+                div.b_text.append(data)
+        if self._a_index is not None:
+            self._a_text.append(data)
+
+    def handle_endtag(self, tag):
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        for closing in range(len(self._stack) - 1, index - 1, -1):
+            self._close(closing)
+        del self._stack[index:]
+
+        if self.username is not None and self.cash is not None:
+            raise _StopParsing()
+
+    def _close(self, index):
+        if self._a_index == index:
+            self.username = "".join(self._a_text)
+            self._a_index = None
+        for div in self._divs:
+            if div.b_index == index:
+                div.b_index = None
+        if self._divs and self._divs[-1].index == index:
+            div = self._divs.pop()
+            if VOTE_CASH_LABEL in "".join(div.text):
+                self._matches.append(div)
+            if not self._divs and self._matches:
+                self._resolve_cash()
+
+    def _resolve_cash(self):
+        # The first matching div in document order that contains a <b> wins
+        candidates = [div for div in self._matches if div.b_text is not None]
+        if candidates:
+            self.cash = "".join(min(candidates, key=lambda d: d.order).b_text)
+        self._matches = []
+
+    def close(self):
+        super().close()
+        # Elements left open at the end of the document count as closed
+        for index in range(len(self._stack) - 1, -1, -1):
+            self._close(index)
+        self._stack = []
+
+
+def extract_htmlparser(text):
+    parser = AccountPageParser()
+    try:
+        parser.feed(text)
+        parser.close()
+    except _StopParsing:
+        pass
+    return parser.username, parser.cash
+
+
+def _has_classes(names):
+    return " and ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+        for name in names
+    )
+
+
+_LXML_CASH_XPATH = (
+    f"(//div[{_has_classes(['col-md-6'])}]"
+    f"[contains(string(.), '{VOTE_CASH_LABEL}')]//b)[1]"
+)
+_LXML_USERNAME_XPATH = (
+    f"(//ul[{_has_classes(USERNAME_UL_CLASSES)}]"
+    f"//li[{_has_classes(USERNAME_LI_CLASSES)}]"
+    f"//a[{_has_classes(['spa'])}])[1]"
+)
+
+
+def extract_lxml(text):
+    try:
+        import lxml.html
+    except ImportError:  # lxml is optional
+        raise RuntimeError("CASH_PARSER=lxml requires the lxml package")
+    root = lxml.html.fromstring(text)
+    cash = root.xpath(_LXML_CASH_XPATH)
+    username = root.xpath(_LXML_USERNAME_XPATH)
+    return (
+        username[0].text_content() if username else None,
+        cash[0].text_content() if cash else None,
+    )
+
+
+def extract_bs4(text):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    vote_cash_element = soup.select_one(
+        f'div.col-md-6:-soup-contains("{VOTE_CASH_LABEL}") b'
+    )
+    username_element = soup.select_one(
+        "ul.nav.navbar-nav.pull-right li.visible-md.visible-lg a.spa"
+    )
+    return (
+        username_element.text if username_element else None,
+        vote_cash_element.text if vote_cash_element else None,
+    )
+
+
+BACKENDS = {
+    "htmlparser": extract_htmlparser,
+    "lxml": extract_lxml,
+    "bs4": extract_bs4,
+}
+
+
+def parse_account_page(text, backend=None):
+    """Return ``(username, cash_amount)`` or ``None`` if either is missing."""
+    username, cash = BACKENDS[backend or CASH_PARSER](text)
+    if username is None or cash is None:
+        return None
+    return username.strip(), int(float(cash.strip().replace(",", "")))
+
+
+_executor = None
+_executor_mode = CASH_PARSE_EXECUTOR
+_executor_workers = CASH_PARSE_WORKERS
+
+
+def configure_parse_executor(mode=CASH_PARSE_EXECUTOR, workers=CASH_PARSE_WORKERS):
+    """Select the executor used by parse_account_page_async.
+
+    The pool itself is created lazily on the first parse.
+    """
+    global _executor_mode, _executor_workers
+    if mode not in PARSE_EXECUTORS:
+        raise ValueError(f"Unknown CASH_PARSE_EXECUTOR: {mode}")
+    shutdown_parse_executor()
+    _executor_mode = mode
+    _executor_workers = workers
+
+
+def _get_executor():
+    global _executor
+    if _executor is None and _executor_mode == "thread":
+        _executor = ThreadPoolExecutor(
+            max_workers=_executor_workers, thread_name_prefix="cash-parse"
+        )
+    elif _executor is None and _executor_mode == "process":
+        # spawn keeps workers independent of the bot's threads and event loop
+        _executor = ProcessPoolExecutor(
+            max_workers=_executor_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_parse_executor(wait=True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+async def parse_account_page_async(text, backend=None):
+    """parse_account_page on the configured executor."""
+    backend = backend or CASH_PARSER
+    started = time.perf_counter()
+    executor = _get_executor()
+    if executor is None:
+        result = parse_account_page(text, backend)
+    else:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor, parse_account_page, text, backend)
+    parse_duration.observe(time.perf_counter() - started, backend)
+    return result
@@ -0,0 +1,482 @@
+"""Fetch cash amounts in separate worker processes.
+
+With CASH_WORKERS=N the bot still schedules the cash_update jobs, sends the
+messages and saves the results, but the account pages are fetched and
+parsed by N worker processes, so a large update slot is not limited to one
+core. The bot and the workers share a SQLite queue (CASH_QUEUE_FILE):
+
+* the bot splits a job's session ids into shards by a hash of the id, so
+  an id always goes to the same worker, and into tasks of
+  CASH_WORKER_BATCH_SIZE ids
+* a worker leases the next task of its shard, renews the lease while it
+  works and stores the results (a username and cash amount, or an error
+  message, per id) in the task row
+* the bot collects finished tasks, resolves the job's fetches and deletes
+  the rows
+
+The bot's side of the queue runs on one thread of its own, so a worker
+holding the database lock never stalls the event loop, and it only polls
+for finished tasks while a job is waiting for some.
+
+When a worker dies the bot starts a new one and releases its leases, and a
+task whose lease ran out can be taken by any worker. A task is given up
+after CASH_TASK_MAX_ATTEMPTS leases and its ids are reported as errors.
+
+Each worker gets an equal share of FETCH_RATE_PER_HOST, so the limit on
+requests to MapleLegends is the same as with a single process.
+
+CASH_WORKERS=0 (the default) fetches in the bot process as before.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CASH_WORKERS = int(os.getenv("CASH_WORKERS", "0"))
+CASH_QUEUE_FILE = os.getenv("CASH_QUEUE_FILE", os.path.join("data", "cash_queue.db"))
+CASH_WORKER_BATCH_SIZE = int(os.getenv("CASH_WORKER_BATCH_SIZE", "200"))
+CASH_LEASE_SECONDS = float(os.getenv("CASH_LEASE_SECONDS", "60"))
+CASH_TASK_MAX_ATTEMPTS = int(os.getenv("CASH_TASK_MAX_ATTEMPTS", "3"))
+CASH_QUEUE_POLL_INTERVAL = 0.1
+# Seconds between checks for dead workers while no task is outstanding
+CASH_WORKER_CHECK_INTERVAL = 5
+
+pool = None
+
+
+class CashQueue:
+    """The task table shared by the bot and the workers."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cash_tasks (
+            id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL,
+            session_ids TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_until REAL,
+            results TEXT
+        );
+        CREATE INDEX IF NOT EXISTS cash_tasks_status
+            ON cash_tasks (status, shard, id);
+    """
+
+    def __init__(self, path=CASH_QUEUE_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; transactions that must be atomic are opened explicitly
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cash_tasks")
+
+    def enqueue(self, tasks):
+        """Insert (shard, session ids) tasks; returns their task ids."""
+        task_ids = []
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for shard, session_ids in tasks:
+                cursor = self.connection.execute(
+                    "INSERT INTO cash_tasks (shard, session_ids) VALUES (?, ?)",
+                    (shard, json.dumps(session_ids)),
+                )
+                task_ids.append(cursor.lastrowid)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return task_ids
+
+    def claim(self, shard, worker, lease_seconds, max_attempts):
+        """Lease the next task of ``shard``, or any task whose lease ran out."""
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute(
+                """
+                SELECT id, session_ids FROM cash_tasks
+                WHERE (status = 'pending' AND shard = ?)
+                   OR (status = 'leased' AND lease_until < ? AND attempts < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (shard, now, max_attempts),
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    """
+                    UPDATE cash_tasks SET status = 'leased', worker = ?,
+                        lease_until = ?, attempts = attempts + 1
+                    WHERE id = ?
+                    """,
+                    (worker, now + lease_seconds, row[0]),
+                )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def renew(self, task_id, worker, lease_seconds):
+        self.connection.execute(
+            "UPDATE cash_tasks SET lease_until = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, task_id, worker),
+        )
+
+    def complete(self, task_id, worker, results):
+        self.connection.execute(
+            "UPDATE cash_tasks SET status = 'done', results = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (json.dumps(results), task_id, worker),
+        )
+
+    def release_worker(self, worker):
+        """Make the leases of a dead worker available right away."""
+        self.connection.execute(
+            "UPDATE cash_tasks SET lease_until = 0 "
+            "WHERE worker = ? AND status = 'leased'",
+            (worker,),
+        )
+
+    def fail_exhausted(self, max_attempts):
+        self.connection.execute(
+            "UPDATE cash_tasks SET status = 'failed' "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (time.time(), max_attempts),
+        )
+
+    def take_finished(self):
+        """Return and delete the done and failed tasks."""
+        rows = self.connection.execute(
+            "SELECT id, status, attempts, results FROM cash_tasks "
+            "WHERE status IN ('done', 'failed')"
+        ).fetchall()
+        if rows:
+            self.connection.executemany(
+                "DELETE FROM cash_tasks WHERE id = ?", [(row[0],) for row in rows]
+            )
+        return rows
+
+    def counts(self):
+        return dict(
+            self.connection.execute(
+                "SELECT status, COUNT(*) FROM cash_tasks GROUP BY status"
+            ).fetchall()
+        )
+
+    def close(self):
+        self.connection.close()
+
+
+def shard_of(session_id, shards):
+    return zlib.crc32(session_id.encode()) % shards
+
+
+class CashWorkerPool:
+    """Starts and supervises the workers and resolves fetches from the queue."""
+
+    def __init__(
+        self,
+        workers=CASH_WORKERS,
+        queue_file=CASH_QUEUE_FILE,
+        batch_size=CASH_WORKER_BATCH_SIZE,
+        lease_seconds=CASH_LEASE_SECONDS,
+        max_attempts=CASH_TASK_MAX_ATTEMPTS,
+    ):
+        self.workers = workers
+        self.queue_file = queue_file
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.queue = None
+        self.processes = {}
+        # task id -> {session id: future}
+        self._pending = {}
+        self._collector = None
+        # The queue's connection lives on this thread only
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cash-queue"
+        )
+        self._lock = None
+        self._wakeup = None
+        # enqueue task -> its futures, until the tasks are in _pending
+        self._enqueues = {}
+        self._counts = {}
+        self.restarts = 0
+        self.tasks_failed = 0
+
+    def _run(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    async def start(self):
+        # Holds off collecting while new tasks are mapped to their futures
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self.queue = await self._run(CashQueue, self.queue_file)
+        # Tasks left from a previous run belong to jobs that no longer wait
+        await self._run(self.queue.clear)
+        for index in range(self.workers):
+            self._spawn(index)
+        self._collector = asyncio.create_task(self._collect())
+        logger.info(f"Started {self.workers} cash workers")
+
+    def _spawn(self, index):
+        # spawn rather than fork, so workers don't inherit the bot's event loop
+        process = multiprocessing.get_context("spawn").Process(
+            target=run_worker,
+            args=(
+                index,
+                self.workers,
+                self.queue_file,
+                self.lease_seconds,
+                self.max_attempts,
+            ),
+            name=f"cash-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def submit(self, session_ids):
+        """Queue the session ids; returns {session id: future of (username, cash)}.
+
+        The tasks are written to the queue in the background.
+        """
+        loop = asyncio.get_running_loop()
+        shards = {}
+        for session_id in session_ids:
+            shard = shard_of(session_id, self.workers)
+            shards.setdefault(shard, []).append(session_id)
+
+        tasks = [
+            (shard, ids[start : start + self.batch_size])
+            for shard, ids in shards.items()
+            for start in range(0, len(ids), self.batch_size)
+        ]
+        task_futures = [
+            {session_id: loop.create_future() for session_id in ids}
+            for _, ids in tasks
+        ]
+        enqueue = asyncio.ensure_future(self._enqueue(tasks, task_futures))
+        self._enqueues[enqueue] = task_futures
+        enqueue.add_done_callback(self._enqueues.pop)
+        return {
+            session_id: future
+            for futures in task_futures
+            for session_id, future in futures.items()
+        }
+
+    async def _enqueue(self, tasks, task_futures):
+        async with self._lock:
+            try:
+                task_ids = await self._run(self.queue.enqueue, tasks)
+            except Exception as e:
+                logger.error(f"Error queueing cash tasks: {str(e)}")
+                for futures in task_futures:
+                    for future in futures.values():
+                        if not future.done():
+                            future.set_exception(e)
+                return
+            self._pending.update(zip(task_ids, task_futures))
+        self._wakeup.set()
+
+    def _poll(self):
+        """Runs on the queue thread: finished tasks and the task counts."""
+        self.queue.fail_exhausted(self.max_attempts)
+        return self.queue.take_finished(), self.queue.counts()
+
+    async def _collect(self):
+        while True:
+            if self._pending:
+                await asyncio.sleep(CASH_QUEUE_POLL_INTERVAL)
+            else:
+                # Nothing to collect: only look after the workers now and then
+                self._counts = {}
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), CASH_WORKER_CHECK_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self._check_workers()
+                if not self._pending:
+                    continue
+                async with self._lock:
+                    finished, self._counts = await self._run(self._poll)
+                for task_id, status, attempts, results in finished:
+                    self._resolve(task_id, status, attempts, results)
+            except Exception as e:
+                logger.error(f"Error collecting cash worker results: {str(e)}")
+
+    async def _check_workers(self):
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            logger.warning(
+                f"Cash worker {index} exited with code {process.exitcode}, restarting"
+            )
+            await self._run(self.queue.release_worker, f"{index}:{process.pid}")
+            self.restarts += 1
+            self._spawn(index)
+
+    def _resolve(self, task_id, status, attempts, results):
+        futures = self._pending.pop(task_id, None)
+        if futures is None:
+            return
+        if status == "failed":
+            self.tasks_failed += 1
+            logger.error(f"Cash task {task_id} failed after {attempts} attempts")
+        results = json.loads(results) if results else {}
+        for session_id, future in futures.items():
+            if future.done():
+                continue
+            result = results.get(session_id)
+            if isinstance(result, list):
+                future.set_result(tuple(result))
+            else:
+                error = result or f"cash worker failed after {attempts} attempts"
+                future.set_exception(RuntimeError(error))
+
+    def stats(self):
+        # As of the last poll; reading the queue here would block the loop
+        counts = self._counts
+        return {
+            "workers": sum(process.is_alive() for process in self.processes.values()),
+            "restarts": self.restarts,
+            "tasks_pending": counts.get("pending", 0),
+            "tasks_leased": counts.get("leased", 0),
+            "tasks_waiting": len(self._pending),
+            "tasks_failed": self.tasks_failed,
+        }
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+        waiting = list(self._pending.values())
+        for enqueue, task_futures in self._enqueues.items():
+            enqueue.cancel()
+            waiting.extend(task_futures)
+        for futures in waiting:
+            for future in futures.values():
+                future.cancel()
+        self._pending.clear()
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+        if self.queue is not None:
+            await self._run(self.queue.close)
+        self._executor.shutdown(wait=False)
+
+
+def run_worker(index, workers, queue_file, lease_seconds, max_attempts):
+    """Entry point of a worker process."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    try:
+        asyncio.run(_work(index, workers, queue_file, lease_seconds, max_attempts))
+    except KeyboardInterrupt:
+        pass
+
+
+def _encode_result(result):
+    """[username, cash] for a fetched account, an error message otherwise."""
+    if isinstance(result, BaseException):
+        return str(result) or type(result).__name__
+    return list(result)
+
+
+async def _renew_lease(queue, task_id, worker, lease_seconds):
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        queue.renew(task_id, worker, lease_seconds)
+
+
+async def _work(index, workers, queue_file, lease_seconds, max_attempts):
+    # Imported here: cash_functions imports this module
+    from cash_functions import get_cash_amount
+    from fetch_scheduler import fetch_scheduler
+    from http_client import close_http_session, start_http_session
+
+    fetch_scheduler.rate_per_host /= workers
+    fetch_scheduler.burst = max(1, fetch_scheduler.burst // workers)
+    queue = CashQueue(queue_file)
+    name = f"{index}:{os.getpid()}"
+    parent = os.getppid()
+    await start_http_session()
+    try:
+        # Stop when the bot goes away, even if it could not terminate us
+        while os.getppid() == parent:
+            task = queue.claim(index, name, lease_seconds, max_attempts)
+            if task is None:
+                await asyncio.sleep(CASH_QUEUE_POLL_INTERVAL)
+                continue
+
+            task_id, session_ids = task
+            renew = asyncio.create_task(
+                _renew_lease(queue, task_id, name, lease_seconds)
+            )
+            try:
+                results = await asyncio.gather(
+                    *(get_cash_amount(session_id) for session_id in session_ids),
+                    return_exceptions=True,
+                )
+            finally:
+                renew.cancel()
+            queue.complete(
+                task_id,
+                name,
+                {
+                    session_id: _encode_result(result)
+                    for session_id, result in zip(session_ids, results)
+                },
+            )
+    finally:
+        await close_http_session()
+        queue.close()
+
+
+async def start_cash_workers(application=None) -> None:
+    """Start the worker pool when CASH_WORKERS is set."""
+    global pool
+    if CASH_WORKERS > 0:
+        workers = CashWorkerPool()
+        try:
+            await workers.start()
+        except Exception:
+            # Without a pool the jobs fetch in the bot process
+            await workers.stop()
+            raise
+        pool = workers
+
+
+async def stop_cash_workers(application=None) -> None:
+    global pool
+    if pool is not None:
+        await pool.stop()
+        pool = None
+
+
+def stats():
+    return pool.stats() if pool is not None else {}
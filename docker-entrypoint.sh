@@ -10,5 +10,8 @@ if [ ! -f /app/cash_watchers.json ]; then
     echo "{}" > /app/cash_watchers.json
 fi
 
+# Directory for the SQLite database
+mkdir -p /app/data
+
 # Execute the CMD from the Dockerfile, e.g., start your Python application
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from profiling import span
+
+logger = logging.getLogger(__name__)
+
+FETCH_MAX_CONCURRENCY = int(os.getenv("FETCH_MAX_CONCURRENCY", "10"))
+FETCH_RATE_PER_HOST = float(os.getenv("FETCH_RATE_PER_HOST", "5"))
+FETCH_BURST = int(os.getenv("FETCH_BURST", "10"))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "3"))
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "10"))
+
+TRANSIENT_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class TokenBucket:
+    """Allow ``rate`` acquisitions per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_transient(error):
+    import aiohttp
+
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+def describe(error):
+    """Short description of a fetch error; never includes request headers."""
+    import aiohttp
+
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"HTTP {error.status}"
+    return type(error).__name__
+
+
+def retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class FetchScheduler:
+    """Run upstream fetches under a global concurrency cap and per-host rate limit.
+
+    Transient failures (timeouts, connection errors, 429 and 5xx responses)
+    are retried with jittered exponential backoff, honouring Retry-After.
+    Waiting for a slot and a token is profiled as the ``queue`` stage and
+    the pauses between retries as ``backoff``.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=FETCH_MAX_CONCURRENCY,
+        rate_per_host=FETCH_RATE_PER_HOST,
+        burst=FETCH_BURST,
+        max_retries=FETCH_MAX_RETRIES,
+        backoff_base=FETCH_BACKOFF_BASE,
+        backoff_max=FETCH_BACKOFF_MAX,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = None
+        self._buckets = {}
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get_semaphore(self):
+        # Created lazily so it binds to the loop the bot actually runs on
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return bucket
+
+    def backoff(self, attempt, error=None):
+        delay = retry_after(error)
+        if delay is not None:
+            return min(delay, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def run(self, host, fetch):
+        """Await ``fetch()`` once a slot and a token for ``host`` are free."""
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(host, fetch)
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                self.retries += 1
+                logger.warning(
+                    f"Transient error fetching from {host} ({describe(e)}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+            with span("backoff"):
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, host, fetch):
+        semaphore = self._get_semaphore()
+        with span("queue"):
+            await self._wait_turn(semaphore, host)
+        try:
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                return await fetch()
+            finally:
+                self.in_flight -= 1
+        finally:
+            semaphore.release()
+
+    async def _wait_turn(self, semaphore, host):
+        """Acquire a slot of ``semaphore`` and then a token for ``host``."""
+        queued_at = time.monotonic()
+        self.queue_depth += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+        try:
+            await self._get_bucket(host).acquire()
+        except BaseException:
+            semaphore.release()
+            raise
+        self._record_wait(queued_at)
+
+    def _record_wait(self, queued_at):
+        waited = time.monotonic() - queued_at
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "wait_avg": self.wait_total / self.requests if self.requests else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+fetch_scheduler = FetchScheduler()
@@ -0,0 +1,65 @@
+import logging
+import os
+
+from metrics import upstream_trace_config
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = os.getenv("MAPLELEGENDS_URL", "https://maplelegends.com").rstrip("/")
+
+# Connection pool settings, overridable from the environment
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+_session = None
+
+
+def create_session():
+    """Create a pooled session with keep-alive and DNS caching."""
+    # Imported on first use so the bot can start taking updates without it
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+    # Every account sends its own webpy_session_id cookie, so the shared
+    # session must never remember cookies between requests.
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        cookie_jar=aiohttp.DummyCookieJar(),
+        trace_configs=[upstream_trace_config()],
+    )
+
+
+def get_session():
+    """Return the application-wide session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_session()
+    return _session
+
+
+async def start_http_session(application=None) -> None:
+    """Open the shared session. Used as the application's post_init hook."""
+    get_session()
+    logger.info(
+        "HTTP session started (limit=%s, limit_per_host=%s)",
+        HTTP_LIMIT,
+        HTTP_LIMIT_PER_HOST,
+    )
+
+
+async def close_http_session(application=None) -> None:
+    """Close the shared session. Used as the application's post_shutdown hook."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
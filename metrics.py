@@ -0,0 +1,288 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are plain dicts keyed by label values, so
+recording a sample costs a dict lookup and a few additions on the event
+loop; nothing is aggregated until ``/metrics`` is scraped. The endpoint is
+served on METRICS_HOST:METRICS_PORT by a small aiohttp server and is off
+when METRICS_PORT is 0.
+
+Instrumented paths:
+
+* command handlers, via ``instrument_handler``
+* MapleLegends requests, via an aiohttp trace config on the shared session
+* account page parsing, in cash_parser
+* job queue lag, via an APScheduler listener, and server monitor lag
+* Telegram Bot API calls, via ``InstrumentedRequest``
+* watcher counts and cache / scheduler stats, read at scrape time
+"""
+
+import bisect
+import functools
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge(Metric):
+    """A gauge whose value is read from ``function`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self):
+        return self.header() + [f"{self.name} {self.function()}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *labelvalues):
+        series = self.values.get(labelvalues)
+        if series is None:
+            series = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = self.header()
+        for labelvalues, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class StatsCollector:
+    """Exports every numeric value of a ``stats()`` dict as a gauge."""
+
+    def __init__(self, prefix, documentation, stats):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+        registry.append(self)
+
+    def render(self):
+        lines = []
+        for key, value in self.stats().items():
+            name = f"{self.prefix}_{key}"
+            lines.append(f"# HELP {name} {self.documentation}: {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return lines
+
+
+registry = []
+
+
+def render():
+    lines = []
+    for metric in registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            logger.error(f"Error collecting metrics: {str(e)}")
+    return "\n".join(lines) + "\n"
+
+
+handler_duration = Histogram(
+    "bot_handler_duration_seconds", "Time spent in a command handler", ["command"]
+)
+handler_errors = Counter(
+    "bot_handler_errors_total", "Command handlers that raised", ["command"]
+)
+upstream_duration = Histogram(
+    "bot_upstream_request_duration_seconds",
+    "MapleLegends request latency until the response headers arrive",
+    ["endpoint"],
+)
+upstream_responses = Counter(
+    "bot_upstream_responses_total",
+    "MapleLegends responses by status code, or the error for failed requests",
+    ["endpoint", "status"],
+)
+parse_duration = Histogram(
+    "bot_cash_parse_duration_seconds",
+    "Account page parse time, including executor queueing",
+    ["backend"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+job_lag = Histogram(
+    "bot_job_lag_seconds",
+    "Delay between a job's scheduled and actual start",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+telegram_duration = Histogram(
+    "bot_telegram_request_duration_seconds", "Bot API call latency", ["method"]
+)
+telegram_responses = Counter(
+    "bot_telegram_responses_total",
+    "Bot API responses by status code, or the error for failed requests",
+    ["method", "status"],
+)
+
+
+def instrument_handler(command, callback):
+    """Wrap a handler callback to record its latency and errors."""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(command)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, command)
+
+    return wrapper
+
+
+def upstream_trace_config():
+    """aiohttp trace config timing every request made on a session."""
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    def finish(context, url, status):
+        # The path identifies the endpoint; query strings and cookies stay out
+        endpoint = url.path
+        upstream_duration.observe(time.perf_counter() - context.started, endpoint)
+        upstream_responses.inc(endpoint, status)
+
+    async def on_request_end(session, context, params):
+        finish(context, params.url, params.response.status)
+
+    async def on_request_exception(session, context, params):
+        finish(context, params.url, type(params.exception).__name__)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and outcome of each Bot API call."""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = urlsplit(url).path.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(
+                url, method, request_data, **kwargs
+            )
+        except Exception as e:
+            telegram_responses.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            telegram_duration.observe(time.perf_counter() - started, api_method)
+        telegram_responses.inc(api_method, status)
+        return status, payload
+
+
+def observe_job_lag(scheduler):
+    """Record how late each job queue job starts."""
+    from apscheduler.events import EVENT_JOB_SUBMITTED
+
+    def on_submitted(event):
+        # One-off jobs are already gone from the job store at this point
+        job = scheduler.get_job(event.job_id)
+        name = job.name if job is not None else "one_off"
+        now = time.time()
+        for scheduled in event.scheduled_run_times:
+            job_lag.observe(now - scheduled.timestamp(), name)
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics; returns the runner, or None when METRICS_PORT is 0."""
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(
+            text=render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,196 @@
+"""Opt-in profiling of command handlers and scheduled jobs.
+
+Handlers and job callbacks are wrapped with ``profiled``. While profiling is
+off (the default) the wrapper only checks a flag and ``span`` returns a
+shared no-op context manager. With ``PROFILE_ENABLED=1``, or after an admin
+sends ``/profile on``, each call gets a trace in a context variable, so tasks
+it spawns add to the same trace. Code marks its stages with
+``with span("fetch"):``. Per stage the trace reports the wall-clock time
+during which at least one span was open, so concurrent spans are not
+counted twice, plus the number of spans and their average and longest
+duration. A call slower than PROFILE_THRESHOLD logs its per-stage times and writes a
+cProfile dump to PROFILE_DIR for offline analysis (for example with
+``python -m pstats`` or snakeviz).
+
+cProfile sees the whole event loop, so a dump also contains whatever else
+ran at the same time. Only one call is captured at a time; overlapping
+calls still record their stage times.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import logging
+import os
+import re
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+PROFILE_THRESHOLD = float(os.getenv("PROFILE_THRESHOLD", "10"))
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id
+}
+
+enabled = PROFILE_ENABLED
+_trace = contextvars.ContextVar("profiling_trace", default=None)
+_NO_SPAN = contextlib.nullcontext()
+_profiler_busy = False
+
+
+class _Stage:
+    """Wall-clock time and span durations of one stage."""
+
+    __slots__ = ("wall", "open", "opened_at", "count", "total", "longest")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.open = 0
+        self.opened_at = 0.0
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+
+class Trace:
+    """Per-stage times of one profiled call."""
+
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages = {}
+
+    def enter(self, stage, now):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = _Stage()
+        if entry.open == 0:
+            entry.opened_at = now
+        entry.open += 1
+
+    def exit(self, stage, started, now):
+        entry = self.stages[stage]
+        entry.open -= 1
+        if entry.open == 0:
+            entry.wall += now - entry.opened_at
+        seconds = now - started
+        entry.count += 1
+        entry.total += seconds
+        entry.longest = max(entry.longest, seconds)
+
+    def summary(self):
+        return ", ".join(
+            f"{stage} {entry.wall:.2f}s ({entry.count}x, "
+            f"avg {entry.total / entry.count:.2f}s, max {entry.longest:.2f}s)"
+            for stage, entry in self.stages.items()
+            if entry.count
+        )
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.trace.enter(self.stage, self.started)
+
+    def __exit__(self, *exc_info):
+        self.trace.exit(self.stage, self.started, time.perf_counter())
+
+
+def span(stage):
+    """Time a stage of the current profiled call; a no-op otherwise."""
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, stage)
+
+
+def set_enabled(value):
+    global enabled
+    enabled = value
+
+
+def profiled(name, callback):
+    """Wrap a handler or job callback so it is profiled while profiling is on."""
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        if not enabled:
+            return await callback(*args, **kwargs)
+        return await _run_profiled(name, callback, args, kwargs)
+
+    return wrapper
+
+
+def _start_profiler():
+    global _profiler_busy
+    if _profiler_busy:
+        return None
+    _profiler_busy = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler):
+    global _profiler_busy
+    profiler.disable()
+    _profiler_busy = False
+
+
+def dump_profile(profiler, name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", name)
+    path = os.path.join(
+        PROFILE_DIR, f"{safe_name}-{time.strftime('%Y%m%d-%H%M%S')}.prof"
+    )
+    profiler.dump_stats(path)
+    return path
+
+
+async def _run_profiled(name, callback, args, kwargs):
+    trace = Trace()
+    token = _trace.set(trace)
+    profiler = _start_profiler()
+    started = time.perf_counter()
+    try:
+        return await callback(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        _trace.reset(token)
+        if profiler is not None:
+            _stop_profiler(profiler)
+        if elapsed >= PROFILE_THRESHOLD:
+            message = f"Slow {name}: {elapsed:.2f}s ({trace.summary() or 'no spans'})"
+            if profiler is not None:
+                try:
+                    message += f", profile written to {dump_profile(profiler, name)}"
+                except OSError as e:
+                    logger.error(f"Error writing profile for {name}: {str(e)}")
+            logger.warning(message)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Turn profiling on or off, or show its state. Admins only."""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        await update.message.reply_text("This command is only available to admins.")
+        return
+
+    if context.args and context.args[0].lower() in ("on", "off"):
+        set_enabled(context.args[0].lower() == "on")
+
+    await update.message.reply_text(
+        f"Profiling is {'on' if enabled else 'off'}. Calls slower than "
+        f"{PROFILE_THRESHOLD:g}s are logged and dumped to {PROFILE_DIR}."
+    )
@@ -0,0 +1,131 @@
+"""Fixed-size history of online user counts.
+
+Samples live in two preallocated ``array`` columns used as a ring buffer, so
+a week of readings takes about 1 MB, appends are O(1), and a
+time window is found by binary search over the (time-ordered) ring.
+"""
+
+import os
+import time
+from array import array
+
+from server_monitor import SERVER_POLL_INTERVAL_UNHEALTHY
+
+SERVER_HISTORY_DAYS = float(os.getenv("SERVER_HISTORY_DAYS", "7"))
+# Enough room for the whole period even if every poll uses the fast interval
+SERVER_HISTORY_SIZE = int(
+    os.getenv(
+        "SERVER_HISTORY_SIZE",
+        str(int(SERVER_HISTORY_DAYS * 86400 / SERVER_POLL_INTERVAL_UNHEALTHY)),
+    )
+)
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted sequence."""
+    return sorted_values[round(fraction * (len(sorted_values) - 1))]
+
+
+class OnlineHistory:
+    """Ring buffer of ``(timestamp, count)`` samples, oldest first."""
+
+    def __init__(self, capacity=SERVER_HISTORY_SIZE):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.counts = array("l", [0]) * capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, count, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        index = (self.start + self.size) % self.capacity
+        self.timestamps[index] = timestamp
+        self.counts[index] = count
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def _slice(self, column, lo, hi):
+        """Samples ``lo`` to ``hi`` (oldest is 0) of one column as an array."""
+        begin = (self.start + lo) % self.capacity
+        end = begin + hi - lo
+        if end <= self.capacity:
+            return column[begin:end]
+        return column[begin:] + column[: end - self.capacity]
+
+    def _first_since(self, timestamp):
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[(self.start + mid) % self.capacity] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def last(self, n):
+        """Counts of the newest ``n`` samples."""
+        n = min(n, self.size)
+        return self._slice(self.counts, self.size - n, self.size)
+
+    def window(self, seconds, now=None):
+        """``(timestamps, counts)`` of the samples from the last ``seconds``."""
+        if now is None:
+            now = time.time()
+        lo = self._first_since(now - seconds)
+        return (
+            self._slice(self.timestamps, lo, self.size),
+            self._slice(self.counts, lo, self.size),
+        )
+
+    def stats(self, seconds, now=None):
+        """Min, average, percentiles and max of a window, or None if it is empty."""
+        counts = sorted(self.window(seconds, now)[1])
+        if not counts:
+            return None
+        return {
+            "samples": len(counts),
+            "min": counts[0],
+            "avg": sum(counts) / len(counts),
+            "p50": percentile(counts, 0.5),
+            "p95": percentile(counts, 0.95),
+            "max": counts[-1],
+        }
+
+    def sparkline(self, seconds, width=24, now=None):
+        """Average count per time column as a line of block characters.
+
+        Columns without samples are left blank. Returns an empty string if
+        the window has no samples.
+        """
+        if now is None:
+            now = time.time()
+        timestamps, counts = self.window(seconds, now)
+        if not counts:
+            return ""
+        start = now - seconds
+        totals = [0] * width
+        samples = [0] * width
+        for timestamp, count in zip(timestamps, counts):
+            column = min(width - 1, int((timestamp - start) * width / seconds))
+            totals[column] += count
+            samples[column] += 1
+        averages = [t / n if n else None for t, n in zip(totals, samples)]
+        low, high = min(counts), max(counts)
+        steps = len(SPARK_CHARS) - 1
+        return "".join(
+            " "
+            if average is None
+            else SPARK_CHARS[round((average - low) * steps / (high - low or 1))]
+            for average in averages
+        )
+
+
+online_history = OnlineHistory()
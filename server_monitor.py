@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+
+from http_client import BASE_URL, get_session
+from metrics import job_lag
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls while the server looks healthy / unhealthy
+SERVER_POLL_INTERVAL = float(os.getenv("SERVER_POLL_INTERVAL", "60"))
+SERVER_POLL_INTERVAL_UNHEALTHY = float(
+    os.getenv("SERVER_POLL_INTERVAL_UNHEALTHY", "10")
+)
+SERVER_POLL_TIMEOUT = float(os.getenv("SERVER_POLL_TIMEOUT", "10"))
+# The server is reported offline once STATUS_CONFIRM_SAMPLES readings in a row
+# are below OFFLINE_THRESHOLD, and online again once as many reach
+# ONLINE_THRESHOLD, so a single odd reading can't flip the status back and forth
+OFFLINE_THRESHOLD = int(os.getenv("OFFLINE_THRESHOLD", "10"))
+ONLINE_THRESHOLD = int(os.getenv("ONLINE_THRESHOLD", str(OFFLINE_THRESHOLD * 2)))
+STATUS_CONFIRM_SAMPLES = int(os.getenv("STATUS_CONFIRM_SAMPLES", "3"))
+
+
+async def get_online_users(session=None):
+    import aiohttp
+
+    if session is None:
+        session = get_session()
+    async with session.get(
+        f"{BASE_URL}/api/get_online_users",
+        timeout=aiohttp.ClientTimeout(total=SERVER_POLL_TIMEOUT),
+    ) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+class ServerMonitor:
+    """Poll the online user count on the event loop and push each reading.
+
+    Every successful reading is recorded in ``history`` (if given) and passed
+    straight to ``on_reading``. The poll interval drops to
+    ``unhealthy_interval`` while the count is below ``ONLINE_THRESHOLD`` or
+    the API can't be reached, so outages and recoveries are confirmed quickly.
+    """
+
+    def __init__(
+        self,
+        on_reading,
+        interval=SERVER_POLL_INTERVAL,
+        unhealthy_interval=SERVER_POLL_INTERVAL_UNHEALTHY,
+        history=None,
+    ):
+        self.on_reading = on_reading
+        self.history = history
+        self.interval = interval
+        self.unhealthy_interval = unhealthy_interval
+        self.count = 0
+        self.healthy = True
+        self._task = None
+
+    async def poll(self):
+        """Take one reading. Returns True if the server looks healthy."""
+        try:
+            online_users_data = await get_online_users()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching online users: {str(e)}")
+            return False
+
+        if online_users_data:
+            self.count = online_users_data.get("usercount", 0)
+            if self.history is not None:
+                self.history.append(self.count)
+            try:
+                await self.on_reading(self.count)
+            except Exception as e:
+                logger.error(f"Error handling server status reading: {str(e)}")
+        return self.count >= ONLINE_THRESHOLD
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.healthy = await self.poll()
+            delay = self.interval if self.healthy else self.unhealthy_interval
+            due = loop.time() + delay
+            await asyncio.sleep(delay)
+            job_lag.observe(loop.time() - due, "server_monitor")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
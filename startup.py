@@ -0,0 +1,55 @@
+"""Startup ordering: take updates first, load the saved state second.
+
+The bot starts polling (or listening for the webhook) before the watchers
+are read from storage, so a restart is answered within the time it takes to
+reach Telegram. ``telegramBot.finish_startup`` loads the state as the first
+job and then sets ``state_loaded``; handlers that read or change the
+watchers are wrapped with ``after_state_loaded`` and wait until then, so
+they never see a half-loaded registry.
+"""
+
+import asyncio
+import functools
+
+
+class ReadyFlag:
+    """A one-way flag coroutines can wait for.
+
+    Unlike asyncio.Event on Python 3.9 it isn't tied to the event loop that
+    was current when it was created, so it can live at module level.
+    """
+
+    def __init__(self):
+        self._ready = False
+        self._waiters = []
+
+    def is_set(self):
+        return self._ready
+
+    def set(self):
+        self._ready = True
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    async def wait(self):
+        if self._ready:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+
+state_loaded = ReadyFlag()
+
+
+def after_state_loaded(callback):
+    """Wrap a handler so it runs only once the saved state is loaded."""
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        await state_loaded.wait()
+        return await callback(*args, **kwargs)
+
+    return wrapper
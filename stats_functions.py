@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import os
+
+from telegram import InputMediaPhoto, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from http_client import BASE_URL, get_session
+from profiling import span
+from storage import get_storage
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Per-request timeouts (seconds) for the character API and the avatar image
+STATS_TIMEOUT = float(os.getenv("STATS_TIMEOUT", "10"))
+AVATAR_TIMEOUT = float(os.getenv("AVATAR_TIMEOUT", "10"))
+
+# Character cache, keyed by lowercase character name
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "300"))
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "1000"))
+STATS_CACHE_MAX_BYTES = int(os.getenv("STATS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Characters per /getStats with several names or per saved roster
+BULK_STATS_MAX_NAMES = int(os.getenv("BULK_STATS_MAX_NAMES", "50"))
+# Characters of one bulk request fetched at the same time
+BULK_STATS_CONCURRENCY = int(os.getenv("BULK_STATS_CONCURRENCY", "8"))
+# Telegram albums hold 2 to 10 photos; messages at most 4096 characters
+MEDIA_GROUP_SIZE = 10
+MAX_MESSAGE_LENGTH = 4096
+# Fields of the character data the bulk reply shows
+STATS_TABLE_FIELDS = ("name", "level", "job", "guild", "fame")
+
+
+class CharacterEntry:
+    """Cached stats and avatar for one character.
+
+    Once the avatar has been uploaded to Telegram its ``file_id`` is kept and
+    the raw bytes are dropped, so repeat sends reuse the uploaded photo.
+    """
+
+    __slots__ = ("data", "avatar", "file_id")
+
+    def __init__(self, data, avatar):
+        self.data = data
+        self.avatar = avatar
+        self.file_id = None
+
+    @property
+    def photo(self):
+        return self.file_id or self.avatar
+
+    def size(self):
+        # Rough per-entry overhead for the stats dict plus the avatar bytes
+        return 1024 + len(self.avatar or b"")
+
+
+character_cache = TTLCache(
+    max_entries=STATS_CACHE_MAX_ENTRIES,
+    max_bytes=STATS_CACHE_MAX_BYTES,
+    ttl=STATS_CACHE_TTL,
+    sizeof=CharacterEntry.size,
+)
+
+
+async def fetch_character_data(character_name, session=None):
+    """Fetch the character stats JSON."""
+    import aiohttp
+
+    if session is None:
+        session = get_session()
+    async with session.get(
+        f"{BASE_URL}/api/character",
+        params={"name": character_name},
+        timeout=aiohttp.ClientTimeout(total=STATS_TIMEOUT),
+    ) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+async def fetch_avatar(character_name, session=None):
+    """Fetch the character avatar PNG bytes."""
+    import aiohttp
+
+    if session is None:
+        session = get_session()
+    async with session.get(
+        f"{BASE_URL}/api/getavatar",
+        params={"name": character_name},
+        timeout=aiohttp.ClientTimeout(total=AVATAR_TIMEOUT),
+    ) as response:
+        response.raise_for_status()
+        return await response.read()
+
+
+async def fetch_character(character_name, session=None):
+    """Fetch stats and avatar at the same time.
+
+    Returns a tuple of (character_data, avatar_bytes); the avatar is None
+    when there is no such character.
+    """
+    character_data, avatar = await asyncio.gather(
+        fetch_character_data(character_name, session),
+        fetch_avatar(character_name, session),
+        return_exceptions=True,
+    )
+    # The stats decide whether the character exists; the avatar request of
+    # an unknown character may fail as well
+    if isinstance(character_data, BaseException):
+        raise character_data
+    if not character_data:
+        return character_data, None
+    if isinstance(avatar, BaseException):
+        raise avatar
+    return character_data, avatar
+
+
+async def get_character(character_name):
+    """Return the cached CharacterEntry, fetching it once if needed."""
+
+    async def load():
+        return CharacterEntry(*await fetch_character(character_name))
+
+    return await character_cache.get_or_load(character_name.lower(), load)
+
+
+def remember_file_id(character_name, entry, message):
+    """Keep the Telegram file_id of an uploaded avatar and drop its bytes."""
+    if entry.file_id is None and message is not None and message.photo:
+        entry.file_id = message.photo[-1].file_id
+        entry.avatar = None
+        character_cache.replace(character_name.lower(), entry)
+
+
+def format_stats_message(character_data):
+    stats_message = f"**Stats for {character_data['name']}:**\n"
+    stats_message += f"• Level: {character_data['level']}\n"
+    stats_message += f"• Gender: {character_data['gender']}\n"
+    stats_message += f"• Job: {character_data['job']}\n"
+    stats_message += f"• EXP: {character_data['exp']}\n"
+    stats_message += f"• Guild: {character_data['guild'] or 'None'}\n"
+    stats_message += f"• Quests Completed: {character_data['quests']}\n"
+    stats_message += f"• Monster Cards: {character_data['cards']}\n"
+    stats_message += f"• Donor: {'Yes' if character_data['donor'] else 'No'}\n"
+    stats_message += f"• Fame: {character_data['fame']}"
+    return stats_message
+
+
+def unique_names(names):
+    """The names in their order, without repeats that differ only in case."""
+    seen = set()
+    result = []
+    for name in names:
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            result.append(name)
+    return result
+
+
+async def fetch_characters(names, concurrency=BULK_STATS_CONCURRENCY):
+    """Fetch many characters through the cache, ``concurrency`` at a time.
+
+    Returns (name, entry, error) per name, in order; ``entry`` is None when
+    the character couldn't be fetched or doesn't exist. One failing name
+    never fails the others.
+    """
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(name):
+        async with semaphore:
+            try:
+                entry = await get_character(name)
+            except asyncio.TimeoutError:
+                return name, None, "request timed out"
+            except aiohttp.ClientError as e:
+                return name, None, str(e)
+            except ValueError:
+                # The API answered with something that isn't JSON
+                return name, None, "invalid response"
+            except Exception as e:
+                logger.error(f"Error fetching character {name}: {str(e)}")
+                return name, None, "error fetching data"
+        if not entry.data:
+            return name, None, "not found"
+        if not isinstance(entry.data, dict) or any(
+            field not in entry.data for field in STATS_TABLE_FIELDS
+        ):
+            return name, None, "incomplete data"
+        return name, entry, None
+
+    return await asyncio.gather(*[fetch(name) for name in names])
+
+
+def album_groups(items, size=MEDIA_GROUP_SIZE):
+    """Split into as few groups of at most ``size`` as possible, sized evenly.
+
+    Evenly sized groups never leave a single photo for the last album,
+    which Telegram would refuse.
+    """
+    count = -(-len(items) // size)
+    return [
+        items[index * len(items) // count : (index + 1) * len(items) // count]
+        for index in range(count)
+    ]
+
+
+async def send_album(update: Update, group):
+    """Send the avatars of [(name, entry)] as one album, captioned by name."""
+
+    async def send(group):
+        if len(group) == 1:
+            name, entry = group[0]
+            message = await update.message.reply_photo(
+                photo=entry.photo, caption=entry.data["name"]
+            )
+            return [message]
+        return await update.message.reply_media_group(
+            media=[
+                InputMediaPhoto(media=entry.photo, caption=entry.data["name"])
+                for name, entry in group
+            ]
+        )
+
+    try:
+        messages = await send(group)
+    except BadRequest:
+        if all(entry.file_id is None for name, entry in group):
+            raise
+        # A stored file_id is no longer valid; upload those avatars again
+        for name, entry in group:
+            if entry.file_id is not None:
+                character_cache.pop(name.lower())
+        group = [
+            (name, await get_character(name) if entry.file_id else entry)
+            for name, entry in group
+        ]
+        messages = await send(group)
+    for (name, entry), message in zip(group, messages):
+        remember_file_id(name, entry, message)
+
+
+def format_stats_table(results, max_length=MAX_MESSAGE_LENGTH):
+    """One monospace table row per character, split into messages if needed."""
+    header = f"{'Name':<13}{'Lvl':>4} {'Job':<14}{'Guild':<13}{'Fame':>5}"
+    rows = []
+    for name, entry, error in results:
+        if entry is None:
+            rows.append(f"{name:<13}   - {error}")
+            continue
+        data = entry.data
+        rows.append(
+            f"{data['name']:<13}{data['level']:>4} {data['job']:<14}"
+            f"{data['guild'] or '-':<13}{data['fame']:>5}"
+        )
+
+    tables = [[header]]
+    length = len(header)
+    for row in rows:
+        # Leave room for the ``` fences around each table
+        if length + len(row) + 9 > max_length:
+            tables.append([header])
+            length = len(header)
+        tables[-1].append(row)
+        length += len(row) + 1
+    return ["```\n" + "\n".join(table) + "\n```" for table in tables]
+
+
+async def send_bulk_stats(update: Update, names) -> None:
+    """Reply with avatar albums and one stats table for many characters."""
+    names = unique_names(names)
+    if len(names) > BULK_STATS_MAX_NAMES:
+        await update.message.reply_text(
+            f"Please ask for at most {BULK_STATS_MAX_NAMES} characters at a time."
+        )
+        return
+
+    with span("fetch"):
+        results = await fetch_characters(names)
+
+    found = [(name, entry) for name, entry, _ in results if entry and entry.photo]
+    with span("send"):
+        for group in album_groups(found):
+            await send_album(update, group)
+        for text in format_stats_table(results):
+            await update.message.reply_text(text, parse_mode="Markdown")
+
+
+async def get_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Fetch and display character stats and avatar."""
+    import aiohttp
+
+    if not context.args:
+        await update.message.reply_text(
+            "Please provide a character name. Usage: /getStats <CharacterName>"
+        )
+        return
+    if len(context.args) > 1:
+        await send_bulk_stats(update, context.args)
+        return
+
+    character_name = context.args[0]
+
+    try:
+        with span("fetch"):
+            entry = await get_character(character_name)
+    except asyncio.TimeoutError:
+        await update.message.reply_text(
+            "Error fetching character data: request timed out"
+        )
+        return
+    except (aiohttp.ClientError, ValueError) as e:
+        # ValueError: the API answered with something that isn't JSON
+        await update.message.reply_text(f"Error fetching character data: {str(e)}")
+        return
+
+    if not entry.data:
+        await update.message.reply_text(
+            f"No data found for character: {character_name}"
+        )
+        return
+
+    # Send avatar image and stats message
+    caption = format_stats_message(entry.data)
+    try:
+        with span("send"):
+            message = await update.message.reply_photo(
+                photo=entry.photo, caption=caption, parse_mode="Markdown"
+            )
+    except BadRequest:
+        if entry.file_id is None:
+            raise
+        # The stored file_id is no longer valid; upload the avatar again
+        character_cache.pop(character_name.lower())
+        entry = await get_character(character_name)
+        message = await update.message.reply_photo(
+            photo=entry.photo, caption=caption, parse_mode="Markdown"
+        )
+    remember_file_id(character_name, entry, message)
+
+
+async def save_roster(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Save a named list of characters for /roster, or delete it."""
+    if not context.args:
+        await update.message.reply_text(
+            "Usage: /saveRoster <roster> <CharacterName> [CharacterName ...]"
+        )
+        return
+
+    user_id = str(update.effective_user.id)
+    roster_name = context.args[0].lower()
+    names = unique_names(context.args[1:])
+
+    if not names:
+        if roster_name not in get_storage().rosters_for_user(user_id):
+            await update.message.reply_text(f"No roster named {roster_name}.")
+            return
+        get_storage().delete_roster(user_id, roster_name)
+        await update.message.reply_text(f"Deleted roster {roster_name}.")
+        return
+
+    if len(names) > BULK_STATS_MAX_NAMES:
+        await update.message.reply_text(
+            f"A roster can hold at most {BULK_STATS_MAX_NAMES} characters."
+        )
+        return
+
+    get_storage().save_roster(user_id, roster_name, names)
+    await update.message.reply_text(
+        f"Saved roster {roster_name} with {len(names)} characters. "
+        f"Use /roster {roster_name} to get their stats."
+    )
+
+
+async def roster(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the stats of a saved roster, or list the saved rosters."""
+    user_id = str(update.effective_user.id)
+    rosters = get_storage().rosters_for_user(user_id)
+
+    if not context.args:
+        if not rosters:
+            await update.message.reply_text(
+                "You don't have any saved rosters. Save one with "
+                "/saveRoster <roster> <CharacterName> [CharacterName ...]"
+            )
+            return
+        lines = [f"{name}: {', '.join(names)}" for name, names in rosters.items()]
+        await update.message.reply_text("Your rosters:\n" + "\n".join(lines))
+        return
+
+    roster_name = context.args[0].lower()
+    names = rosters.get(roster_name)
+    if names is None:
+        await update.message.reply_text(f"No roster named {roster_name}.")
+        return
+
+    await send_bulk_stats(update, names)
@@ -0,0 +1,693 @@
+"""Persistence for cash watchers, server status watchers and rosters.
+
+Two interchangeable backends share one interface:
+
+* ``SQLiteStorage`` (the default) keeps one row per watcher in a WAL-mode
+  database, so a single command writes a single row. On first start it
+  imports the existing JSON files.
+* ``JsonStorage`` keeps the original flat files. Changes mark the state
+  dirty and a background thread writes it at most once per
+  ``JSON_SAVE_INTERVAL`` seconds (temp file, fsync, atomic rename), so the
+  event loop never waits on disk.
+
+Select one with ``STORAGE_BACKEND=sqlite|json``.
+
+Both also keep the cash history of each watched account: at most one sample
+per account and day, each carrying running totals so that cash_history can
+answer windowed questions from two samples instead of a scan.
+"""
+
+import bisect
+import errno
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+DATABASE_FILE = os.getenv("DATABASE_FILE", os.path.join("data", "maplelegends.db"))
+CASH_WATCHERS_FILE = os.getenv("CASH_WATCHERS_FILE", "cash_watchers.json")
+USERS_FILE = os.getenv("USERS_FILE", "watching_users.json")
+CASH_HISTORY_FILE = os.getenv(
+    "CASH_HISTORY_FILE", os.path.join("data", "cash_history.json")
+)
+ROSTERS_FILE = os.getenv("ROSTERS_FILE", os.path.join("data", "rosters.json"))
+JSON_SAVE_INTERVAL = float(os.getenv("JSON_SAVE_INTERVAL", "2"))
+
+_storage = None
+
+
+def _read_json(path, default):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return default
+
+
+def write_atomic(path, text):
+    """Replace ``path`` with ``text`` via a synced temp file and rename."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # A file bind-mounted by docker can't be renamed over; write in place
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+        os.remove(tmp_path)
+        with open(path, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _week(day):
+    """Year and week number of an ISO date, matching SQLite's strftime('%Y-%W')."""
+    return datetime.strptime(day, "%Y-%m-%d").strftime("%Y-%W")
+
+
+class DebouncedWriter:
+    """Write-behind persistence for one file.
+
+    ``mark_dirty`` is cheap and never touches the disk. A daemon thread waits
+    ``interval`` seconds after the first change, so a burst of changes turns
+    into one write of the latest ``snapshot()``. ``flush`` writes any pending
+    change synchronously and stops the thread.
+    """
+
+    def __init__(self, path, snapshot, interval=JSON_SAVE_INTERVAL):
+        self.path = path
+        self.snapshot = snapshot
+        self.interval = interval
+        self.writes = 0
+        self._pending = False
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def mark_dirty(self):
+        self._pending = True
+        self._wake.set()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"save-{os.path.basename(self.path)}",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Collect further changes for one interval; flush cuts it short
+            if self._stopping.wait(self.interval):
+                return
+            self._wake.clear()
+            self._write()
+
+    def _write(self):
+        with self._write_lock:
+            if not self._pending:
+                return
+            self._pending = False
+            try:
+                write_atomic(self.path, self.snapshot())
+                self.writes += 1
+            except Exception as e:
+                logger.error(f"Error saving {self.path}: {str(e)}")
+                self._pending = True
+
+    def flush(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+            self._stopping.clear()
+            self._wake.clear()
+        self._write()
+
+
+class JsonStorage:
+    """Flat JSON files, written behind by a DebouncedWriter per file."""
+
+    def __init__(
+        self,
+        cash_watchers_file=CASH_WATCHERS_FILE,
+        users_file=USERS_FILE,
+        interval=JSON_SAVE_INTERVAL,
+        *,
+        cash_history_file=CASH_HISTORY_FILE,
+        rosters_file=ROSTERS_FILE,
+    ):
+        self.cash_watchers_file = cash_watchers_file
+        self.users_file = users_file
+        # Own copy of the state as user_id -> {account id: entry}. The lock
+        # keeps the writer threads from serializing it mid-change.
+        self._cash_watchers = {}
+        self._watching_users = set()
+        # "user_id:account_id" -> [[day, timestamp, cash, cash_sum, samples]]
+        self._cash_history = _read_json(cash_history_file, {})
+        # user_id -> {roster name: [character name]}
+        self._rosters = _read_json(rosters_file, {})
+        self._lock = threading.Lock()
+        self.cash_watchers_writer = DebouncedWriter(
+            cash_watchers_file, self._dump_cash_watchers, interval
+        )
+        self.users_writer = DebouncedWriter(
+            users_file, self._dump_watching_users, interval
+        )
+        self.cash_history_writer = DebouncedWriter(
+            cash_history_file, self._dump_cash_history, interval
+        )
+        self.rosters_writer = DebouncedWriter(
+            rosters_file, self._dump_rosters, interval
+        )
+
+    def load_cash_watchers(self):
+        data = _read_json(self.cash_watchers_file, {})
+        self._cash_watchers = {
+            user_id: {entry["id"]: dict(entry) for entry in entries}
+            for user_id, entries in data.items()
+        }
+        return data
+
+    def iter_cash_watchers(self, batch_size):
+        """Every watcher as lists of up to ``batch_size`` (user_id, entry)."""
+        batch = []
+        for user_id, entries in self.load_cash_watchers().items():
+            for entry in entries:
+                batch.append((user_id, entry))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def watchers_for_user(self, user_id):
+        return [dict(entry) for entry in self._cash_watchers.get(user_id, {}).values()]
+
+    def watchers_at(self, update_time):
+        return [
+            (user_id, dict(entry))
+            for user_id, entries in self._cash_watchers.items()
+            for entry in entries.values()
+            if entry["update_time"] == update_time
+        ]
+
+    def save_cash_watcher(self, user_id, entry):
+        with self._lock:
+            self._cash_watchers.setdefault(user_id, {})[entry["id"]] = dict(entry)
+        self.cash_watchers_writer.mark_dirty()
+
+    def delete_cash_watcher(self, user_id, account_id):
+        with self._lock:
+            entries = self._cash_watchers.get(user_id, {})
+            entries.pop(account_id, None)
+            if not entries:
+                self._cash_watchers.pop(user_id, None)
+        self.cash_watchers_writer.mark_dirty()
+
+    def save_cash_results(self, results):
+        with self._lock:
+            for user_id, entry in results:
+                self._cash_watchers.setdefault(user_id, {})[entry["id"]] = dict(entry)
+        self.cash_watchers_writer.mark_dirty()
+
+    def _dump_cash_watchers(self):
+        with self._lock:
+            return json.dumps(
+                {
+                    user_id: list(entries.values())
+                    for user_id, entries in self._cash_watchers.items()
+                }
+            )
+
+    def load_watching_users(self):
+        self._watching_users = set(_read_json(self.users_file, []))
+        return set(self._watching_users)
+
+    def add_watching_user(self, user_id):
+        with self._lock:
+            self._watching_users.add(user_id)
+        self.users_writer.mark_dirty()
+
+    def remove_watching_user(self, user_id):
+        with self._lock:
+            self._watching_users.discard(user_id)
+        self.users_writer.mark_dirty()
+
+    def remove_watching_users(self, user_ids):
+        with self._lock:
+            self._watching_users.difference_update(user_ids)
+        self.users_writer.mark_dirty()
+
+    def _dump_watching_users(self):
+        with self._lock:
+            return json.dumps(list(self._watching_users))
+
+    @staticmethod
+    def _sample(user_id, account_id, row):
+        day, timestamp, cash, cash_sum, samples = row
+        return {
+            "user_id": user_id,
+            "account_id": account_id,
+            "day": day,
+            "timestamp": timestamp,
+            "cash": cash,
+            "cash_sum": cash_sum,
+            "samples": samples,
+        }
+
+    def _history_rows(self, user_id, account_id):
+        return self._cash_history.get(f"{user_id}:{account_id}", [])
+
+    def latest_cash_sample(self, user_id, account_id):
+        rows = self._history_rows(user_id, account_id)
+        return self._sample(user_id, account_id, rows[-1]) if rows else None
+
+    def latest_cash_samples(self, keys):
+        """latest_cash_sample for many ``(user_id, account_id)`` pairs at once."""
+        samples = {}
+        for user_id, account_id in keys:
+            rows = self._history_rows(user_id, account_id)
+            if rows:
+                samples[user_id, account_id] = self._sample(
+                    user_id, account_id, rows[-1]
+                )
+        return samples
+
+    def first_cash_sample(self, user_id, account_id):
+        rows = self._history_rows(user_id, account_id)
+        return self._sample(user_id, account_id, rows[0]) if rows else None
+
+    def cash_sample_at(self, user_id, account_id, day):
+        rows = self._history_rows(user_id, account_id)
+        index = bisect.bisect_right(rows, [day, float("inf")])
+        return self._sample(user_id, account_id, rows[index - 1]) if index else None
+
+    def save_cash_samples(self, samples):
+        with self._lock:
+            for sample in samples:
+                rows = self._cash_history.setdefault(
+                    f"{sample['user_id']}:{sample['account_id']}", []
+                )
+                row = [
+                    sample["day"],
+                    sample["timestamp"],
+                    sample["cash"],
+                    sample["cash_sum"],
+                    sample["samples"],
+                ]
+                if rows and rows[-1][0] == sample["day"]:
+                    rows[-1] = row
+                else:
+                    rows.append(row)
+        self.cash_history_writer.mark_dirty()
+
+    def downsample_cash_history(self, before_day):
+        with self._lock:
+            for key, rows in self._cash_history.items():
+                # A row before the cutoff survives if it is the last one
+                # before the cutoff in its week, as in SQLiteStorage
+                kept = [
+                    row
+                    for row, following in zip(rows, rows[1:] + [None])
+                    if row[0] >= before_day
+                    or following is None
+                    or following[0] >= before_day
+                    or _week(row[0]) != _week(following[0])
+                ]
+                self._cash_history[key] = kept
+        self.cash_history_writer.mark_dirty()
+
+    def delete_cash_history(self, user_id, account_id):
+        with self._lock:
+            self._cash_history.pop(f"{user_id}:{account_id}", None)
+        self.cash_history_writer.mark_dirty()
+
+    def _dump_cash_history(self):
+        with self._lock:
+            return json.dumps(self._cash_history, separators=(",", ":"))
+
+    def rosters_for_user(self, user_id):
+        rosters = self._rosters.get(user_id, {})
+        return {name: list(rosters[name]) for name in sorted(rosters)}
+
+    def save_roster(self, user_id, name, characters):
+        with self._lock:
+            self._rosters.setdefault(user_id, {})[name] = list(characters)
+        self.rosters_writer.mark_dirty()
+
+    def delete_roster(self, user_id, name):
+        with self._lock:
+            rosters = self._rosters.get(user_id, {})
+            rosters.pop(name, None)
+            if not rosters:
+                self._rosters.pop(user_id, None)
+        self.rosters_writer.mark_dirty()
+
+    def _dump_rosters(self):
+        with self._lock:
+            return json.dumps(self._rosters)
+
+    def close(self):
+        """Write any pending changes before shutdown."""
+        self.cash_watchers_writer.flush()
+        self.users_writer.flush()
+        self.cash_history_writer.flush()
+        self.rosters_writer.flush()
+
+
+class SQLiteStorage:
+    """One row per watcher in a WAL-mode SQLite database."""
+
+    # Two parameters per pair, under the 999 limit of older SQLite builds
+    LATEST_SAMPLES_CHUNK = 400
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cash_watchers (
+            user_id TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            last_cash INTEGER NOT NULL DEFAULT 0,
+            update_time TEXT NOT NULL,
+            PRIMARY KEY (user_id, account_id)
+        );
+        CREATE INDEX IF NOT EXISTS cash_watchers_update_time
+            ON cash_watchers (update_time);
+        CREATE TABLE IF NOT EXISTS watching_users (
+            user_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS cash_history (
+            user_id TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            cash INTEGER NOT NULL,
+            cash_sum INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (user_id, account_id, day)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rosters (
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            characters TEXT NOT NULL,
+            PRIMARY KEY (user_id, name)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(
+        self,
+        path=DATABASE_FILE,
+        cash_watchers_file=CASH_WATCHERS_FILE,
+        users_file=USERS_FILE,
+    ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.migrate_json(cash_watchers_file, users_file)
+
+    def migrate_json(self, cash_watchers_file, users_file):
+        """Import the JSON files once, the first time the database is used."""
+        migrated = self.conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'json_migrated'"
+        ).fetchone()
+        if migrated:
+            return
+        cash_watchers = _read_json(cash_watchers_file, {})
+        watching_users = _read_json(users_file, [])
+        with self.conn:
+            self.conn.executemany(
+                self._UPSERT_WATCHER,
+                [
+                    self._watcher_row(user_id, entry)
+                    for user_id, entries in cash_watchers.items()
+                    for entry in entries
+                ],
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO watching_users (user_id) VALUES (?)",
+                [(user_id,) for user_id in watching_users],
+            )
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', '1')"
+            )
+        count = sum(len(entries) for entries in cash_watchers.values())
+        if count or watching_users:
+            logger.info(
+                f"Migrated {count} cash watchers and {len(watching_users)} "
+                f"server status watchers from JSON into {self.path}"
+            )
+
+    _UPSERT_WATCHER = """
+        INSERT INTO cash_watchers
+            (user_id, account_id, username, last_cash, update_time)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, account_id) DO UPDATE SET
+            username = excluded.username,
+            last_cash = excluded.last_cash,
+            update_time = excluded.update_time
+    """
+
+    @staticmethod
+    def _watcher_row(user_id, entry):
+        return (
+            user_id,
+            entry["id"],
+            entry["username"],
+            entry.get("last_cash", 0),
+            entry["update_time"],
+        )
+
+    @staticmethod
+    def _entry(row):
+        return {
+            "id": row["account_id"],
+            "username": row["username"],
+            "last_cash": row["last_cash"],
+            "update_time": row["update_time"],
+        }
+
+    def load_cash_watchers(self):
+        cash_watchers = {}
+        for row in self.conn.execute("SELECT * FROM cash_watchers ORDER BY rowid"):
+            cash_watchers.setdefault(row["user_id"], []).append(self._entry(row))
+        return cash_watchers
+
+    def iter_cash_watchers(self, batch_size):
+        """Every watcher as lists of up to ``batch_size`` (user_id, entry).
+
+        Rows are read from the database as the batches are consumed, so the
+        whole table is never held in memory twice.
+        """
+        cursor = self.conn.execute("SELECT * FROM cash_watchers ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [(row["user_id"], self._entry(row)) for row in rows]
+
+    def watchers_for_user(self, user_id):
+        rows = self.conn.execute(
+            "SELECT * FROM cash_watchers WHERE user_id = ? ORDER BY rowid", (user_id,)
+        )
+        return [self._entry(row) for row in rows]
+
+    def watchers_at(self, update_time):
+        rows = self.conn.execute(
+            "SELECT * FROM cash_watchers WHERE update_time = ?", (update_time,)
+        )
+        return [(row["user_id"], self._entry(row)) for row in rows]
+
+    def save_cash_watcher(self, user_id, entry):
+        with self.conn:
+            self.conn.execute(self._UPSERT_WATCHER, self._watcher_row(user_id, entry))
+
+    def delete_cash_watcher(self, user_id, account_id):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM cash_watchers WHERE user_id = ? AND account_id = ?",
+                (user_id, account_id),
+            )
+
+    def save_cash_results(self, results):
+        """Store the fetched cash and username of many watchers in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE cash_watchers SET last_cash = ?, username = ? "
+                "WHERE user_id = ? AND account_id = ?",
+                [
+                    (entry.get("last_cash", 0), entry["username"], user_id, entry["id"])
+                    for user_id, entry in results
+                ],
+            )
+
+    def load_watching_users(self):
+        rows = self.conn.execute("SELECT user_id FROM watching_users")
+        return {row[0] for row in rows}
+
+    def add_watching_user(self, user_id):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO watching_users (user_id) VALUES (?)", (user_id,)
+            )
+
+    def remove_watching_user(self, user_id):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM watching_users WHERE user_id = ?", (user_id,)
+            )
+
+    def remove_watching_users(self, user_ids):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM watching_users WHERE user_id = ?",
+                [(user_id,) for user_id in user_ids],
+            )
+
+    def _cash_sample(self, query, params):
+        row = self.conn.execute(
+            f"SELECT * FROM cash_history WHERE user_id = ? AND account_id = ? {query}",
+            params,
+        ).fetchone()
+        return dict(row) if row else None
+
+    def latest_cash_sample(self, user_id, account_id):
+        return self._cash_sample("ORDER BY day DESC LIMIT 1", (user_id, account_id))
+
+    def latest_cash_samples(self, keys):
+        """latest_cash_sample for many ``(user_id, account_id)`` pairs at once.
+
+        One query per LATEST_SAMPLES_CHUNK pairs instead of one per pair.
+        """
+        keys = list(dict.fromkeys(keys))
+        samples = {}
+        for start in range(0, len(keys), self.LATEST_SAMPLES_CHUNK):
+            chunk = keys[start : start + self.LATEST_SAMPLES_CHUNK]
+            rows = self.conn.execute(
+                "WITH wanted (user_id, account_id) AS (VALUES "
+                + ", ".join(["(?, ?)"] * len(chunk))
+                + ") SELECT cash_history.* FROM wanted JOIN cash_history "
+                "ON cash_history.user_id = wanted.user_id "
+                "AND cash_history.account_id = wanted.account_id "
+                "AND cash_history.day = (SELECT MAX(day) FROM cash_history AS latest "
+                "WHERE latest.user_id = wanted.user_id "
+                "AND latest.account_id = wanted.account_id)",
+                [value for key in chunk for value in key],
+            )
+            for row in rows:
+                samples[row["user_id"], row["account_id"]] = dict(row)
+        return samples
+
+    def first_cash_sample(self, user_id, account_id):
+        return self._cash_sample("ORDER BY day LIMIT 1", (user_id, account_id))
+
+    def cash_sample_at(self, user_id, account_id, day):
+        """The newest sample taken on or before ``day``."""
+        return self._cash_sample(
+            "AND day <= ? ORDER BY day DESC LIMIT 1", (user_id, account_id, day)
+        )
+
+    def save_cash_samples(self, samples):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO cash_history "
+                "(user_id, account_id, day, timestamp, cash, cash_sum, samples) "
+                "VALUES (:user_id, :account_id, :day, :timestamp, :cash, "
+                ":cash_sum, :samples)",
+                samples,
+            )
+
+    def downsample_cash_history(self, before_day):
+        """Keep only the last sample of each week for days before ``before_day``."""
+        with self.conn:
+            self.conn.execute(
+                """
+                DELETE FROM cash_history
+                WHERE day < :before_day
+                  AND (user_id, account_id, day) NOT IN (
+                      SELECT user_id, account_id, MAX(day) FROM cash_history
+                      WHERE day < :before_day
+                      GROUP BY user_id, account_id, strftime('%Y-%W', day)
+                  )
+                """,
+                {"before_day": before_day},
+            )
+
+    def delete_cash_history(self, user_id, account_id):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM cash_history WHERE user_id = ? AND account_id = ?",
+                (user_id, account_id),
+            )
+
+    def rosters_for_user(self, user_id):
+        """The user's rosters as {name: [character name]}, by name."""
+        rows = self.conn.execute(
+            "SELECT name, characters FROM rosters WHERE user_id = ? ORDER BY name",
+            (user_id,),
+        )
+        return {row["name"]: json.loads(row["characters"]) for row in rows}
+
+    def save_roster(self, user_id, name, characters):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rosters (user_id, name, characters) "
+                "VALUES (?, ?, ?)",
+                (user_id, name, json.dumps(list(characters))),
+            )
+
+    def delete_roster(self, user_id, name):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM rosters WHERE user_id = ? AND name = ?", (user_id, name)
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "json":
+        return JsonStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage():
+    """Return the application-wide storage, opening it on first use."""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def close_storage():
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
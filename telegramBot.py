@@ -1,9 +1,11 @@
-import json
+import asyncio
 import logging
 import os
+import signal
+from datetime import time
+from functools import partial
+from typing import Optional
 
-import requests
-from dotenv import load_dotenv
 from telegram import ForceReply, Update
 from telegram.ext import (
     Application,
@@ -13,16 +15,41 @@ from telegram.ext import (
     filters,
 )
 
+import cash_workers
+import metrics
+from broadcast import Broadcaster
 from cash_functions import (
+    cash_cache_stats,
     get_cash,
     handle_update_cash,
     load_cash_watchers,
     remove_cash_watcher,
     schedule_cash_updates,
     watch_cash,
+    watchers,
 )
-
-load_dotenv()
+from cash_history import cash_history, downsample_cash_history
+from cash_parser import shutdown_parse_executor
+from fetch_scheduler import fetch_scheduler
+from http_client import close_http_session, start_http_session
+from profiling import profile_command, profiled
+from server_history import SERVER_HISTORY_DAYS, online_history
+from server_monitor import (
+    OFFLINE_THRESHOLD,
+    ONLINE_THRESHOLD,
+    STATUS_CONFIRM_SAMPLES,
+    ServerMonitor,
+)
+from startup import after_state_loaded, state_loaded
+from stats_functions import (
+    BULK_STATS_MAX_NAMES,
+    character_cache,
+    get_stats,
+    roster,
+    save_roster,
+)
+from storage import close_storage, get_storage
+from update_processor import PerUserUpdateProcessor, create_background_task
 
 # Enable logging
 logging.basicConfig(
@@ -32,24 +59,37 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-# Global variables to store shared count and lock
-shared_count = None
-count_lock = None
+# "polling" asks Telegram for updates; "webhook" has them pushed (see webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Updates handled at once; each user's updates still run one after another
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+# Every handler reads update.message, so other update types are not requested
+ALLOWED_UPDATES = [Update.MESSAGE]
+# Bot API server to talk to, for example a local one; empty uses Telegram's
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "")
+# Commands that read or change the watchers wait until they are loaded
+STATEFUL_COMMANDS = {
+    "watchServerStatus",
+    "watchCash",
+    "updateCash",
+    "removeCashWatcher",
+    "cashHistory",
+}
+# Commands whose handler only starts a background task that profiles itself
+BACKGROUND_COMMANDS = {"updateCash"}
+
+# Polls the online user count and fans out status alerts; created in post_init
+# and started once the saved state is loaded
+server_monitor = None
+broadcaster = None
+metrics_runner = None
 watching_users = set()
 is_server_offline = False
-USERS_FILE = "watching_users.json"
 
 
 def load_watching_users():
     global watching_users
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            watching_users = set(json.load(f))
-
-
-def save_watching_users():
-    with open(USERS_FILE, "w") as f:
-        json.dump(list(watching_users), f)
+    watching_users = get_storage().load_watching_users()
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -67,12 +107,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "Available commands:\n\n"
         "/start - Start the bot and receive a welcome message\n"
         "/serverStatus - Show the current server status\n"
+        "/serverHistory [hours] - Show the online user count over the last hours (default 24)\n"
         "/watchServerStatus - Toggle server status notifications on/off\n"
-        "/getStats <CharacterName> - Get stats and avatar for a specific character\n"
+        f"/getStats <CharacterName> [CharacterName ...] - Get stats and avatar for one or more characters (up to {BULK_STATS_MAX_NAMES}), sent as albums with one stats table\n"
+        "/saveRoster <roster> <CharacterName> [CharacterName ...] - Save a list of characters under a name; without names, delete the roster\n"
+        "/roster [roster] - Get stats for every character of a saved roster, or list your rosters\n"
         "/getCash <id> - Get the amount of vote cash for a given user ID. You can learn about how to get the id in https://github.com/Luisotee/maplelegends_bot\n"
         "/watchCash <HH:MM> <your_maplelegends_id> - Daily updates of your vote cash amount at <HH:MM> UTC\n"
         "/removeCashWatcher <username> - Remove a specific cash watcher\n"
         "/updateCash - Get an immediate update of cash amounts for all your registered accounts\n"
+        "/cashHistory <username> - Show 7, 30 and 90 day vote cash changes for one of your accounts\n"
         "/help - Show this help message\n"
     )
     await update.message.reply_text(help_text)
@@ -93,139 +137,274 @@ async def watch_server_status(
 
     if user_id in watching_users:
         watching_users.remove(user_id)
+        get_storage().remove_watching_user(user_id)
         await update.message.reply_text(
             "You will no longer receive server status notifications."
         )
     else:
         watching_users.add(user_id)
+        get_storage().add_watching_user(user_id)
         await update.message.reply_text(
             "You will now receive server status notifications."
         )
 
-    save_watching_users()  # Save the updated list
-
 
-async def check_server_status(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check server status and notify users if necessary."""
+async def check_server_status(application: Application, count) -> None:
+    """Notify users when the recent online counts change the server status."""
     global is_server_offline
-    with count_lock:
-        count = shared_count.value
 
-    if count < 10 and not is_server_offline:
+    recent = online_history.last(STATUS_CONFIRM_SAMPLES)
+    if len(recent) < STATUS_CONFIRM_SAMPLES:
+        return
+
+    if max(recent) < OFFLINE_THRESHOLD and not is_server_offline:
         is_server_offline = True
-        for user_id in watching_users:
-            await context.bot.send_message(
-                chat_id=user_id, text="Warning: Server is offline (player count < 10)!"
-            )
-    elif count >= 10 and is_server_offline:
+        text = f"Warning: Server is offline (player count < {OFFLINE_THRESHOLD})!"
+    elif min(recent) >= ONLINE_THRESHOLD and is_server_offline:
         is_server_offline = False
-        for user_id in watching_users:
-            await context.bot.send_message(
-                chat_id=user_id, text="Server is back online!"
-            )
+        text = "Server is back online!"
+    else:
+        return
+
+    # Send in the background so a long fan-out doesn't delay the next reading
+    create_background_task(application, notify_watching_users(text))
+
+
+async def notify_watching_users(text) -> None:
+    """Broadcast a status message and forget users who blocked the bot."""
+    result = await broadcaster.broadcast(list(watching_users), text)
+    if result.blocked:
+        watching_users.difference_update(result.blocked)
+        get_storage().remove_watching_users(result.blocked)
+    logger.info(f"Server status broadcast: {result}")
 
 
 async def server_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show the current server status."""
-    global is_server_offline
-    with count_lock:
-        count = shared_count.value
+    if not online_history:
+        await update.message.reply_text(
+            "Server status not known yet, please try again in a moment."
+        )
+        return
+    count = server_monitor.count
 
-    if count < 10:
-        status = "Offline"
-    else:
-        status = "Online"
+    # The confirmed status is the one status alerts were sent for
+    status = "Offline" if is_server_offline else "Online"
+    note = ""
+    if is_server_offline and count >= ONLINE_THRESHOLD:
+        note = "\nThe latest reading looks online; waiting for it to be confirmed."
+    elif not is_server_offline and count < OFFLINE_THRESHOLD:
+        note = "\nThe latest reading looks offline; waiting for it to be confirmed."
 
     await update.message.reply_text(
-        f"Server Status: {status}\nCurrent online users: {count}"
+        f"Server Status: {status}\nCurrent online users: {count}{note}"
     )
 
 
-async def get_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Fetch and display character stats and avatar."""
-    if not context.args:
+async def server_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the recorded online user counts as a sparkline."""
+    try:
+        hours = float(context.args[0]) if context.args else 24
+    except ValueError:
+        hours = 0
+    max_hours = SERVER_HISTORY_DAYS * 24
+    if not 0 < hours <= max_hours:
         await update.message.reply_text(
-            "Please provide a character name. Usage: /getStats <CharacterName>"
+            f"Please provide a number of hours up to {max_hours:g}. "
+            "Usage: /serverHistory [hours]"
         )
         return
 
-    character_name = context.args[0]
-    stats_url = f"https://maplelegends.com/api/character?name={character_name}"
-    avatar_url = f"https://maplelegends.com/api/getavatar?name={character_name}"
+    seconds = hours * 3600
+    stats = online_history.stats(seconds)
+    if stats is None:
+        await update.message.reply_text("No server status readings recorded yet.")
+        return
 
+    await update.message.reply_text(
+        f"Online users over the last {hours:g}h:\n"
+        f"{online_history.sparkline(seconds)}\n"
+        f"Now: {online_history.last(1)[0]}  Min: {stats['min']}  "
+        f"Avg: {stats['avg']:.0f}  P95: {stats['p95']}  Max: {stats['max']}\n"
+        f"Samples: {stats['samples']}"
+    )
+
+
+def register_metrics(application: Application) -> None:
+    """Export watcher counts, update processing and cache / scheduler stats."""
+    metrics.Gauge(
+        "bot_cash_watchers",
+        "Watched MapleLegends accounts",
+        lambda: len(watchers),
+    )
+    metrics.Gauge(
+        "bot_server_status_watchers",
+        "Users receiving server status notifications",
+        lambda: len(watching_users),
+    )
+    metrics.Gauge(
+        "bot_online_users",
+        "Last online user count",
+        lambda: server_monitor.count if server_monitor else 0,
+    )
+    metrics.StatsCollector(
+        "bot_fetch_scheduler", "Fetch scheduler", fetch_scheduler.stats
+    )
+    metrics.StatsCollector("bot_cash_cache", "Account page cache", cash_cache_stats)
+    metrics.StatsCollector(
+        "bot_character_cache", "Character stats cache", character_cache.stats
+    )
+    metrics.StatsCollector(
+        "bot_updates", "Update processing", application.update_processor.stats
+    )
+    metrics.StatsCollector("bot_cash_workers", "Cash worker pool", cash_workers.stats)
+
+
+async def post_init(application: Application) -> None:
+    """Prepare what must exist before the first update is handled.
+
+    Everything slower waits for finish_startup, so polling starts right away.
+    """
+    global broadcaster, server_monitor
+    metrics.observe_job_lag(application.job_queue.scheduler)
+    broadcaster = Broadcaster(application.bot)
+    # Each online count reading goes straight to the notification logic
+    server_monitor = ServerMonitor(
+        partial(check_server_status, application), history=online_history
+    )
+
+
+async def finish_startup(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Load the saved state, rebuild the jobs and start the background work.
+
+    Runs as the first job, while updates are already being handled.
+    """
+    global metrics_runner
+    application = context.application
+    loop = asyncio.get_running_loop()
+    started = loop.time()
     try:
-        # Fetch character stats
-        stats_response = requests.get(stats_url)
-        stats_response.raise_for_status()
-        character_data = stats_response.json()
-
-        if not character_data:
-            await update.message.reply_text(
-                f"No data found for character: {character_name}"
-            )
-            return
-
-        # Prepare stats message
-        stats_message = f"**Stats for {character_data['name']}:**\n"
-        stats_message += f"• Level: {character_data['level']}\n"
-        stats_message += f"• Gender: {character_data['gender']}\n"
-        stats_message += f"• Job: {character_data['job']}\n"
-        stats_message += f"• EXP: {character_data['exp']}\n"
-        stats_message += f"• Guild: {character_data['guild'] or 'None'}\n"
-        stats_message += f"• Quests Completed: {character_data['quests']}\n"
-        stats_message += f"• Monster Cards: {character_data['cards']}\n"
-        stats_message += f"• Donor: {'Yes' if character_data['donor'] else 'No'}\n"
-        stats_message += f"• Fame: {character_data['fame']}"
-
-        # Fetch avatar image
-        avatar_response = requests.get(avatar_url)
-        avatar_response.raise_for_status()
-
-        # Send avatar image and stats message
-        await update.message.reply_photo(
-            photo=avatar_response.content, caption=stats_message, parse_mode="Markdown"
-        )
+        load_watching_users()
+        count = await load_cash_watchers()
+    except Exception as e:
+        # Without its state the bot can't run; shut down like on SIGTERM
+        logger.error(f"Error loading the saved state: {str(e)}")
+        signal.raise_signal(signal.SIGTERM)
+        return
+    state_loaded.set()
+    logger.info(f"Loaded {count} cash watchers in {loop.time() - started:.2f}s")
 
-    except requests.exceptions.RequestException as e:
-        await update.message.reply_text(f"Error fetching character data: {str(e)}")
+    # Status alerts need the watching users, so the monitor starts now
+    server_monitor.start()
+    schedule_cash_updates(context)
+    await start_http_session(application)
 
+    # Optional services: a failure is logged and leaves the rest running
+    try:
+        await cash_workers.start_cash_workers(application)
+    except Exception as e:
+        logger.error(f"Error starting the cash workers: {str(e)}")
+    try:
+        metrics_runner = await metrics.start_metrics_server()
+    except Exception as e:
+        logger.error(f"Error starting the metrics server: {str(e)}")
+    logger.info(f"Startup finished in {loop.time() - started:.2f}s")
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release shared resources after the application has stopped."""
+    if server_monitor is not None:
+        await server_monitor.stop()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await cash_workers.stop_cash_workers(application)
+    await close_http_session(application)
+    shutdown_parse_executor()
+    close_storage()
+
+
+def build_application(
+    bot_token: str, mode: str = BOT_MODE, base_url: Optional[str] = None
+) -> Application:
+    """Create the Application with every handler registered."""
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if mode == "webhook":
+        # Updates arrive through webhook.py, so no Updater is needed
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Add command handlers, timed per command
+    commands = {
+        "start": start,
+        "help": help_command,
+        "watchServerStatus": watch_server_status,
+        "getStats": get_stats,
+        "saveRoster": save_roster,
+        "roster": roster,
+        "getCash": get_cash,
+        "watchCash": watch_cash,
+        "serverStatus": server_status,
+        "serverHistory": server_history,
+        "updateCash": handle_update_cash,
+        "removeCashWatcher": remove_cash_watcher,
+        "cashHistory": cash_history,
+    }
+    for command, callback in commands.items():
+        if command in STATEFUL_COMMANDS:
+            callback = after_state_loaded(callback)
+        if command not in BACKGROUND_COMMANDS:
+            callback = profiled(command, callback)
+        callback = metrics.instrument_handler(command, callback)
+        application.add_handler(CommandHandler(command, callback))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(
+        MessageHandler(
+            filters.TEXT, metrics.instrument_handler("invalid", invalid_command)
+        )
+    )
+    return application
 
-def runTelegramBot(shared_count_param, count_lock_param) -> None:
-    global shared_count, count_lock
-    shared_count = shared_count_param
-    count_lock = count_lock_param
 
+def runTelegramBot() -> None:
     print("Telegram bot started")
 
-    # Load watching users and cash watchers from files
-    load_watching_users()
-    load_cash_watchers()
-
     # Get the bot token from the environment variable
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not bot_token:
         raise ValueError("Telegram bot token not found in environment variables")
-
-    # Create the Application and pass it your bot's token.
-    application = Application.builder().token(bot_token).build()
-
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("watchServerStatus", watch_server_status))
-    application.add_handler(CommandHandler("getStats", get_stats))
-    application.add_handler(CommandHandler("getCash", get_cash))
-    application.add_handler(CommandHandler("watchCash", watch_cash))
-    application.add_handler(CommandHandler("serverStatus", server_status))
-    application.add_handler(CommandHandler("updateCash", handle_update_cash))
-    application.add_handler(CommandHandler("removeCashWatcher", remove_cash_watcher))
-    application.add_handler(MessageHandler(filters.TEXT, invalid_command))
-
-    # Schedule cash updates
-    schedule_cash_updates(application)
-
-    # Set up job to check server status every minute
-    application.job_queue.run_repeating(check_server_status, interval=60)
+    if BOT_MODE not in ("polling", "webhook"):
+        raise ValueError(f"Unknown BOT_MODE {BOT_MODE!r}, use polling or webhook")
+
+    application = build_application(bot_token, base_url=TELEGRAM_BASE_URL or None)
+    register_metrics(application)
+
+    # The saved state is loaded and the cash update jobs are scheduled by the
+    # first job, so the bot answers while they are still being rebuilt
+    application.job_queue.run_once(finish_startup, 0, name="finish_startup")
+    application.job_queue.run_daily(
+        profiled("cash_history_downsample", downsample_cash_history),
+        time=time(0, 30),
+        name="cash_history_downsample",
+    )
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+
+        # Same loop as run_polling uses, which the application was built on
+        loop = asyncio.get_event_loop()
+        try:
+            loop.run_until_complete(run_webhook(application, ALLOWED_UPDATES))
+        finally:
+            loop.close()
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
@@ -0,0 +1,78 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = storage.SQLiteStorage(
+            str(tmp_path / "test.db"),
+            str(tmp_path / "none.json"),
+            str(tmp_path / "none.json"),
+        )
+    else:
+        store = storage.JsonStorage(
+            str(tmp_path / "cash_watchers.json"),
+            str(tmp_path / "watching_users.json"),
+            cash_history_file=str(tmp_path / "cash_history.json"),
+            rosters_file=str(tmp_path / "rosters.json"),
+        )
+    yield store
+    store.close()
+
+
+def save_daily_samples(store, first_day, days):
+    store.save_cash_samples(
+        [
+            {
+                "user_id": "1",
+                "account_id": "a",
+                "day": (first_day + timedelta(days=offset)).isoformat(),
+                "timestamp": offset,
+                "cash": offset,
+                "cash_sum": offset,
+                "samples": offset + 1,
+            }
+            for offset in range(days)
+        ]
+    )
+
+
+def history_days(store):
+    if isinstance(store, storage.SQLiteStorage):
+        rows = store.conn.execute("SELECT day FROM cash_history ORDER BY day")
+        return [row[0] for row in rows]
+    return [row[0] for row in store._history_rows("1", "a")]
+
+
+def test_downsample_keeps_last_sample_before_cutoff_in_its_week(store):
+    # Monday 2026-01-05 to Friday 2026-01-09, all in one week
+    save_daily_samples(store, date(2026, 1, 5), 5)
+    store.downsample_cash_history("2026-01-08")
+    assert history_days(store) == ["2026-01-07", "2026-01-08", "2026-01-09"]
+
+
+def test_downsample_keeps_one_sample_per_week_before_cutoff(store):
+    # Monday 2025-12-01 for five weeks, cutoff on Monday 2025-12-29
+    save_daily_samples(store, date(2025, 12, 1), 35)
+    store.downsample_cash_history("2025-12-29")
+    assert history_days(store) == [
+        "2025-12-07",
+        "2025-12-14",
+        "2025-12-21",
+        "2025-12-28",
+        "2025-12-29",
+        "2025-12-30",
+        "2025-12-31",
+        "2026-01-01",
+        "2026-01-02",
+        "2026-01-03",
+        "2026-01-04",
+    ]
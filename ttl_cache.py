@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and single-flight loading.
+
+    Entries are evicted least-recently-used first once either ``max_entries``
+    or ``max_bytes`` (as measured by ``sizeof``) is exceeded. Concurrent
+    ``get_or_load`` calls for the same key share one loader call.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=300, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._inflight = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return entry[2]
+
+    def set(self, key, value, ttl=None):
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._store(key, value, expires_at)
+
+    def replace(self, key, value):
+        """Swap the value of a live entry, keeping its expiry and re-measuring it."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._remove(key)
+        self._store(key, value, entry[0])
+
+    def _store(self, key, value, expires_at):
+        size = self.sizeof(value)
+        self._entries[key] = (expires_at, size, value)
+        self.bytes += size
+        self._evict()
+
+    def pop(self, key):
+        if key in self._entries:
+            return self._remove(key)
+        return None
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key):
+        _, size, value = self._entries.pop(key)
+        self.bytes -= size
+        return value
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    async def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value or await ``loader()`` to produce it.
+
+        Callers arriving while a load for ``key`` is running wait for that
+        load instead of starting their own; they count as coalesced, only the
+        caller that starts the load counts as a miss. Failed loads are not
+        cached.
+        """
+        value = self.get(key, count=False)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[key] = task
+        # Shield so one cancelled caller doesn't cancel the load for the rest
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, ttl):
+        try:
+            value = await loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
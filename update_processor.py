@@ -0,0 +1,109 @@
+"""Concurrent update processing that keeps each user's updates in order.
+
+python-telegram-bot hands every update to the processor as its own task.
+``PerUserUpdateProcessor`` lets updates from different users run side by
+side, up to ``max_concurrent_updates`` at once, while updates from the same
+user (or chat, for updates without a user) wait for the previous one to
+finish. An update waiting for its user's turn does not hold one of the
+running slots, so a user sending many commands cannot starve the others.
+
+Handlers that start work in the background use ``create_background_task``,
+which goes through ``Application.create_task``: exceptions reach the error
+handlers and the task is awaited when the application stops.
+"""
+
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Updates admitted at once, running or waiting; beyond this new updates wait
+# for the oldest to finish
+MAX_PENDING_UPDATES = 4096
+
+background_tasks = set()
+
+
+def ordering_key(update):
+    """The user, or failing that the chat, whose updates must stay in order."""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    __slots__ = ("_running", "_queues", "running", "waiting", "processed")
+
+    def __init__(self, max_concurrent_updates: int):
+        # The base class semaphore only bounds admitted updates; the running
+        # limit is applied once an update's turn has come
+        super().__init__(max(MAX_PENDING_UPDATES, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # ordering key -> [lock, updates holding or waiting for it]
+        self._queues = {}
+        self.running = 0
+        self.waiting = 0
+        self.processed = 0
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = [asyncio.Lock(), 0]
+        queue[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first in, first out
+            async with queue[0]:
+                await self._run(coroutine)
+        finally:
+            queue[1] -= 1
+            if not queue[1]:
+                del self._queues[key]
+
+    async def _run(self, coroutine):
+        self.waiting += 1
+        try:
+            await self._running.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._running.release()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting
+            + sum(count - 1 for _, count in self._queues.values()),
+            "users": len(self._queues),
+            "processed": self.processed,
+            "background_tasks": len(background_tasks),
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def create_background_task(application: Application, coroutine, update=None):
+    """Start a tracked task that outlives the handler that created it."""
+    task = application.create_task(coroutine, update=update)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
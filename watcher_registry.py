@@ -0,0 +1,142 @@
+"""In-memory registry of cash watchers.
+
+Each watched account is one ``CashWatcher`` record (``__slots__``, no
+per-instance dict). The registry keeps two indexes:
+
+* telegram user id -> {session id: watcher}
+* update time -> the slot's watchers
+
+A lookup by username scans only that user's few watchers, which is cheaper
+than a third index holding a key and a lower-case copy of every username.
+All changes go through the registry's methods so the indexes never drift
+apart. Storage keeps its own format; ``CashWatcher.to_dict`` and
+``WatcherRegistry.load`` convert at that boundary.
+"""
+
+
+class CashWatcher:
+    __slots__ = ("user_id", "id", "username", "last_cash", "update_time")
+
+    def __init__(self, user_id, id, username, last_cash=0, update_time="00:00"):
+        self.user_id = user_id
+        self.id = id
+        self.username = username
+        self.last_cash = last_cash
+        self.update_time = update_time
+
+    @classmethod
+    def from_dict(cls, user_id, entry):
+        return cls(
+            user_id,
+            entry["id"],
+            entry["username"],
+            entry.get("last_cash", 0),
+            entry["update_time"],
+        )
+
+    def to_dict(self):
+        """The entry as stored by storage.py."""
+        return {
+            "id": self.id,
+            "username": self.username,
+            "last_cash": self.last_cash,
+            "update_time": self.update_time,
+        }
+
+    def __repr__(self):
+        return (
+            f"CashWatcher({self.user_id!r}, {self.id!r}, {self.username!r}, "
+            f"{self.last_cash!r}, {self.update_time!r})"
+        )
+
+
+class WatcherRegistry:
+    def __init__(self):
+        # user id -> {session id: watcher}, in the order they were added
+        self._by_user = {}
+        # update time -> {watcher: None}, an insertion ordered set
+        self._by_time = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for watchers in self._by_user.values():
+            yield from watchers.values()
+
+    def __contains__(self, watcher):
+        return self.get(watcher.user_id, watcher.id) is watcher
+
+    def clear(self):
+        self._by_user.clear()
+        self._by_time.clear()
+        self._count = 0
+
+    def load(self, cash_watchers):
+        """Replace the contents with storage's {user id: [entry dict]}."""
+        self.clear()
+        for user_id, entries in cash_watchers.items():
+            for entry in entries:
+                self.add(CashWatcher.from_dict(user_id, entry))
+
+    def get(self, user_id, session_id):
+        watchers = self._by_user.get(user_id)
+        return watchers.get(session_id) if watchers else None
+
+    def for_user(self, user_id):
+        return list(self._by_user.get(user_id, {}).values())
+
+    def find_by_username(self, user_id, username):
+        """The first of the user's watchers with this username, ignoring case."""
+        username = username.lower()
+        for watcher in self._by_user.get(user_id, {}).values():
+            if watcher.username.lower() == username:
+                return watcher
+        return None
+
+    def at_time(self, update_time):
+        return list(self._by_time.get(update_time, ()))
+
+    def update_times(self):
+        return list(self._by_time)
+
+    def has_update_time(self, update_time):
+        return update_time in self._by_time
+
+    def add(self, watcher):
+        """Add a watcher, replacing any with the same user and session id."""
+        if self.get(watcher.user_id, watcher.id) is not None:
+            self.remove(watcher.user_id, watcher.id)
+        self._by_user.setdefault(watcher.user_id, {})[watcher.id] = watcher
+        self._by_time.setdefault(watcher.update_time, {})[watcher] = None
+        self._count += 1
+
+    def remove(self, user_id, session_id):
+        """Remove and return a watcher, or None if there is none."""
+        watcher = self.get(user_id, session_id)
+        if watcher is None:
+            return None
+        _discard(self._by_user, user_id, session_id)
+        _discard(self._by_time, watcher.update_time, watcher)
+        self._count -= 1
+        return watcher
+
+    def set_update_time(self, watcher, update_time):
+        _discard(self._by_time, watcher.update_time, watcher)
+        watcher.update_time = update_time
+        self._by_time.setdefault(update_time, {})[watcher] = None
+
+    def set_result(self, watcher, username, cash):
+        """Record a fetched username and cash amount."""
+        watcher.username = username
+        watcher.last_cash = cash
+
+
+def _discard(index, key, member):
+    """Remove ``member`` from ``index[key]``, dropping the key once empty."""
+    members = index.get(key)
+    if members is not None:
+        members.pop(member, None)
+        if not members:
+            del index[key]
@@ -0,0 +1,103 @@
+"""Webhook mode: Telegram pushes updates to a small aiohttp server.
+
+With BOT_MODE=webhook the bot registers WEBHOOK_URL + WEBHOOK_PATH with
+Telegram and listens on WEBHOOK_LISTEN:WEBHOOK_PORT, usually behind a TLS
+terminating reverse proxy. Every request must carry the secret token in the
+X-Telegram-Bot-Api-Secret-Token header; anything else gets a 403. Without
+WEBHOOK_SECRET_TOKEN a random token is generated on each start, which works
+because the webhook is registered again every time.
+
+Accepted updates go onto the application's update queue, the same place
+long polling puts them, so handlers behave the same in both modes.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import secrets
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def start_webhook_server(
+    application: Application,
+    secret_token: str,
+    listen: str = WEBHOOK_LISTEN,
+    port: int = WEBHOOK_PORT,
+    path: str = WEBHOOK_PATH,
+) -> web.AppRunner:
+    """Serve the webhook endpoint; returns the runner to clean up on exit."""
+    expected = secret_token.encode()
+
+    async def handle_update(request):
+        received = request.headers.get(SECRET_TOKEN_HEADER, "").encode()
+        if not hmac.compare_digest(received, expected):
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.error(f"Error decoding webhook update: {str(e)}")
+            return web.Response(status=400)
+
+        await application.update_queue.put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    return runner
+
+
+async def run_webhook(application: Application, allowed_updates) -> None:
+    """Run the application in webhook mode until SIGINT or SIGTERM."""
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE is webhook")
+
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        # Listen before registering so the first pushed updates are accepted
+        runner = await start_webhook_server(application, secret_token)
+        try:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            await application.start()
+            logger.info(f"Receiving updates on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+            await stop.wait()
+        finally:
+            await runner.cleanup()
+            if application.running:
+                await application.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)